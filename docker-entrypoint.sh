@@ -48,6 +48,11 @@ elasticdump \
   --output=http://elastic:9200/genres \
   --type=data --csvHandleNestedData
 
-# start app
-gunicorn main:app --workers 1 --worker-class \
-uvicorn.workers.UvicornWorker --bind fastapi:8000
+# person filmography
+python -m etl.person_movies
+
+# индексы перезалиты: сброс кэша сменой версий ключей
+python -m services.cache.versions movies persons genres
+
+# start app: воркеры, цикл событий и адрес - SERVER_* в env/.env.settings
+exec gunicorn main:app --config gunicorn.conf.py
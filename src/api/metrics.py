@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import Response
+
+from core.metrics import render
+from db.store import Store, get_store
+from services.cache.cache import get_cache
+
+router = APIRouter()
+
+
+@router.get('/metrics', include_in_schema=False)
+async def metrics(store: Store = Depends(get_store)) -> Response:
+    local = get_cache(store).local
+    return Response(
+        render(local.stats() if local is not None else None),
+        media_type='text/plain; version=0.0.4'
+        )
@@ -0,0 +1,64 @@
+""" Условные запросы: ETag, Cache-Control и ответ 304 Not Modified
+
+ETag считается по телу из кэша сервиса, до разбора его в модель: при
+совпадении с If-None-Match клиенту (или nginx) уходит пустой 304.
+Если ручка строит ответ из тела кэша по другой схеме, в ETag входит
+версия этого представления: новая схема ответа - новый ETag.
+
+max-age короткий: ETag не знает о сбросе версий кэша, и nginx с
+клиентами видят новые данные не позже MAX_AGE секунд, а перепроверка
+по If-None-Match дешёвая.
+"""
+from hashlib import blake2b
+from http import HTTPStatus
+from typing import List, Optional
+
+from fastapi import Header
+from fastapi.responses import Response
+
+ETAG_HEADER = 'ETag'
+CACHE_CONTROL_HEADER = 'Cache-Control'
+MAX_AGE = 60
+
+
+def get_if_none_match(
+        if_none_match: str = Header(
+            None,
+            description="ETag из предыдущего ответа: если данные не "
+                        "изменились, ответ 304 без тела"
+            )
+        ) -> List[str]:
+    if not if_none_match:
+        return []
+    # слабое сравнение (RFC 7232): nginx с gzip отдаёт W/"..."
+    return [
+        tag.strip()[2:] if tag.strip().startswith('W/') else tag.strip()
+        for tag in if_none_match.split(',')
+        ]
+
+
+def etag(payload: bytes, representation: str = '') -> str:
+    digest = blake2b(representation.encode() + b'\n', digest_size=16)
+    digest.update(payload)
+    return '"{0}"'.format(digest.hexdigest())
+
+
+def conditional_response(
+        response: Response,
+        payload: bytes,
+        if_none_match: List[str],
+        representation: str = ''
+        ) -> Optional[Response]:
+    """Ставит в response ETag и Cache-Control.
+
+    Возвращает 304 с теми же заголовками, если у клиента актуальная
+    версия, иначе None - ручка отдаёт тело как обычно.
+    """
+    headers = {
+        ETAG_HEADER: etag(payload, representation),
+        CACHE_CONTROL_HEADER: 'public, max-age={0}'.format(MAX_AGE),
+        }
+    response.headers.update(headers)
+    if headers[ETAG_HEADER] in if_none_match or '*' in if_none_match:
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    return None
@@ -3,6 +3,9 @@ from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException
 
+from api.v1.conditional import conditional_response, get_if_none_match
+from api.v1.responses import JSONBytesResponse, model_response
+from core.timing import VALIDATION, timed
 from services.genre import GenreService, get_genre_service
 from schemas.genre import Genre
 
@@ -19,16 +22,18 @@ router = APIRouter()
 async def genre_details(
         uuid: str,
         genre_service: GenreService = Depends(get_genre_service)
-        ) -> Genre:
+        ) -> JSONBytesResponse:
     genre = await genre_service.get_by_id(uuid)
     if not genre:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND, detail='genre not found')
-    return Genre(
-        uuid=genre.id,
-        name=genre.name,
-        description=genre.description
-        )
+    with timed(VALIDATION):
+        genre = Genre(
+            uuid=genre.id,
+            name=genre.name,
+            description=genre.description
+            )
+    return model_response(genre)
 
 
 @router.get('/',
@@ -38,19 +43,16 @@ async def genre_details(
             response_description="Жанры и их описания",
             tags=['Жанры'])
 async def get_all_genres(
+        if_none_match: List[str] = Depends(get_if_none_match),
         genre_service: GenreService = Depends(get_genre_service)
-        ) -> List[Genre]:
+        ) -> JSONBytesResponse:
     genres = await genre_service.get_all_genres()
     if not genres:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND, detail='genre not found')
-    genres_api = []
-    for genre in genres:
-        genres_api.append(
-            Genre(
-                uuid=genre.id,
-                name=genre.name,
-                description=genre.description
-                )
-            )
-    return genres_api
+    response = JSONBytesResponse(genres)
+    return conditional_response(
+        response,
+        genres,
+        if_none_match
+        ) or response
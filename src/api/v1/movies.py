@@ -1,15 +1,27 @@
 from http import HTTPStatus
-from typing import Annotated, List
+from typing import Annotated, List, Optional
 import uuid
 
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response
 
+from api.v1.conditional import conditional_response, get_if_none_match
+from api.v1.pagination import get_index_search_after, \
+    get_movie_search_after
+from api.v1.responses import JSONBytesResponse, model_response, \
+    page_response
+from core.timing import VALIDATION, timed
+from models.movie import Movie
 from services.movie import MovieService, get_movie_service
 from schemas.movie_short import MovieShort
 from schemas.movie_info import MovieInfo
 from services.sorting import sorting
 
 
+# ответ - MovieInfo из Movie в кэше: при смене схемы MovieInfo
+# версию нужно поднять, иначе ETag останется прежним
+MOVIE_INFO_VERSION = 'MovieInfo.1'
+
 router = APIRouter()
 
 
@@ -19,22 +31,37 @@ router = APIRouter()
             tags=['Фильмы'])
 async def movie_details(
         movie_id: str,
+        response: Response,
+        if_none_match: List[str] = Depends(get_if_none_match),
         movie_service: MovieService = Depends(get_movie_service)
-        ) -> MovieInfo:
-    movie = await movie_service.get_by_id(movie_id)
-    if not movie:
+        ) -> JSONBytesResponse:
+    data = await movie_service.get_raw_by_id(movie_id)
+    if not data:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND, detail='Movie not found')
-    return MovieInfo(
-        uuid=movie.id,
-        title=movie.title,
-        imdb_rating=movie.imdb_rating,
-        description=movie.description,
-        genre=movie.genre,
-        actors=movie.actors,
-        writers=movie.writers,
-        directors=movie.directors
+    not_modified = conditional_response(
+        response,
+        data,
+        if_none_match,
+        MOVIE_INFO_VERSION
         )
+    if not_modified:
+        return not_modified
+    with timed(VALIDATION):
+        movie = Movie.parse_raw(data)
+        movie_info = MovieInfo(
+            uuid=movie.id,
+            title=movie.title,
+            imdb_rating=movie.imdb_rating,
+            description=movie.description,
+            genre=movie.genre,
+            actors=movie.actors,
+            writers=movie.writers,
+            directors=movie.directors
+            )
+    # заголовки ETag и Cache-Control, поставленные conditional_response:
+    # у возвращённого ответа FastAPI их из response не переносит
+    return model_response(movie_info, response.headers)
 
 
 @router.get("/search/",
@@ -48,19 +75,21 @@ async def movie_search(
         query: str,
         movie_service: MovieService = Depends(get_movie_service),
         page_number: Annotated[int, Query(1, ge=1, lt=200)] = 1,
-        page_size: Annotated[int, Query(50, ge=10, lt=100)] = 50
-        ) -> List[MovieShort]:
+        page_size: Annotated[int, Query(50, ge=10, lt=100)] = 50,
+        search_after: Optional[list] = Depends(get_movie_search_after)
+        ) -> JSONBytesResponse:
 
     find_movies = await movie_service.get_find_movies(
         query,
         page_number,
-        page_size
+        page_size,
+        search_after
         )
     if not find_movies:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND, detail='Movies not found, Sorry')
 
-    return find_movies
+    return page_response(find_movies)
 
 
 @router.get('/',
@@ -75,8 +104,9 @@ async def get_index(
         movie_service: MovieService = Depends(get_movie_service),
         sort: str = "-imdb_rating",
         page_number: Annotated[int, Query(1, ge=1, lt=200)] = 1,
-        page_size: Annotated[int, Query(50, ge=10, lt=100)] = 50
-        ) -> List[MovieShort]:
+        page_size: Annotated[int, Query(50, ge=10, lt=100)] = 50,
+        search_after: Optional[list] = Depends(get_index_search_after)
+        ) -> JSONBytesResponse:
 
     order, sorted_field = sorting(sort)
     if genre:
@@ -85,7 +115,8 @@ async def get_index(
             sorted_field,
             page_number,
             page_size,
-            genre
+            genre,
+            search_after
             )
     else:
         sorted_movies = await movie_service.get_sorted_movies(
@@ -93,10 +124,11 @@ async def get_index(
             sorted_field,
             page_number,
             page_size,
+            search_after
             )
     if not sorted_movies:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND,
             detail='If you see this page: we are failed, sorry')
 
-    return sorted_movies
+    return page_response(sorted_movies)
@@ -0,0 +1,53 @@
+from http import HTTPStatus
+from typing import Optional
+
+from fastapi import HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse
+
+from services.pagination import InvalidCursor, MOVIES_SCORE_SORT, \
+    PERSONS_SCORE_SORT, cursor_sort, decode_cursor
+from services.sorting import sorting
+
+CURSOR_QUERY = Query(
+    None,
+    description="Курсор из заголовка X-Next-Cursor предыдущей "
+                "страницы. С курсором page_number не учитывается"
+    )
+
+
+def parse_cursor(cursor: Optional[str], sort: str) -> Optional[list]:
+    if not cursor:
+        return None
+    try:
+        return decode_cursor(cursor, sort)
+    except InvalidCursor:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST, detail='Invalid cursor')
+
+
+# поиск: курсор выдан поиском той же сущности
+def get_movie_search_after(cursor: str = CURSOR_QUERY) -> Optional[list]:
+    return parse_cursor(cursor, MOVIES_SCORE_SORT)
+
+
+def get_person_search_after(cursor: str = CURSOR_QUERY) -> Optional[list]:
+    return parse_cursor(cursor, PERSONS_SCORE_SORT)
+
+
+# главная: курсор должен быть выдан для той же сортировки
+def get_index_search_after(
+        cursor: str = CURSOR_QUERY,
+        sort: str = "-imdb_rating"
+        ) -> Optional[list]:
+    return parse_cursor(cursor, cursor_sort(*sorting(sort)))
+
+
+# значения курсора, которые ES не смог сравнить с полем сортировки
+async def invalid_cursor_handler(
+        request: Request,
+        exc: InvalidCursor
+        ) -> ORJSONResponse:
+    return ORJSONResponse(
+        {'detail': 'Invalid cursor'},
+        status_code=HTTPStatus.BAD_REQUEST
+        )
@@ -1,8 +1,11 @@
 from http import HTTPStatus
-from typing import Annotated, List
+from typing import Annotated, List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 
+from api.v1.conditional import conditional_response, get_if_none_match
+from api.v1.pagination import get_person_search_after
+from api.v1.responses import JSONBytesResponse, page_response
 from services.person import PersonService, get_person_service
 from services.movie import MovieService, get_movie_service
 from schemas.movie_short import MovieShort
@@ -21,15 +24,22 @@ router = APIRouter()
             )
 async def person_details(
         uuid: str,
+        if_none_match: List[str] = Depends(get_if_none_match),
         person_service: PersonService = Depends(get_person_service)
-        ) -> Person:
-    person = await person_service.get_by_id(uuid)  # Person
-    if not person:
+        ) -> JSONBytesResponse:
+    # в кэше лежит готовое тело ответа schemas.person.Person
+    data = await person_service.get_raw_by_id(uuid)
+    if not data:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND,
             detail='Person not found')
 
-    return person
+    response = JSONBytesResponse(data)
+    return conditional_response(
+        response,
+        data,
+        if_none_match
+        ) or response
 
 
 @router.get(
@@ -44,9 +54,15 @@ async def movies_by_person(
         uuid: str,
         person_service: PersonService = Depends(get_person_service),
         movie_service: MovieService = Depends(get_movie_service)
-        ) -> List[MovieShort]:
+        ) -> JSONBytesResponse:
 
-    return await person_service.get_movies_by_person(uuid, movie_service)
+    movies = await person_service.get_movies_by_person(uuid, movie_service)
+    if not movies:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail='Person not found')
+
+    return JSONBytesResponse(movies.body)
 
 
 @router.get('/search/',
@@ -60,17 +76,19 @@ async def persons_search(
         query: str,
         person_service: PersonService = Depends(get_person_service),
         page_number: Annotated[int, Query(1, ge=1, lt=200)] = 1,
-        page_size: Annotated[int, Query(50, ge=10, lt=100)] = 50
-        ) -> List[Person]:
+        page_size: Annotated[int, Query(50, ge=10, lt=100)] = 50,
+        search_after: Optional[list] = Depends(get_person_search_after)
+        ) -> JSONBytesResponse:
 
     find_persons = await person_service.get_find_persons(
         query,
         page_number,
-        page_size
+        page_size,
+        search_after
         )
 
     if not find_persons:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND, detail='Person not found')
 
-    return find_persons
+    return page_response(find_persons)
@@ -0,0 +1,38 @@
+from typing import Mapping, Optional
+
+from fastapi.responses import Response
+import orjson
+from pydantic import BaseModel
+
+from core.timing import SERIALIZATION, timed
+from services.pagination import Page
+
+# курсор следующей страницы для пагинации через search_after
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+class JSONBytesResponse(Response):
+    """Ответ из уже сериализованного JSON (например, тела из кэша).
+
+    FastAPI не прогоняет такой ответ через response_model, поэтому модель
+    в декораторе ручки остаётся только для документации.
+    """
+    media_type = 'application/json'
+
+
+def page_response(page: Page) -> JSONBytesResponse:
+    response = JSONBytesResponse(page.body)
+    if page.cursor:
+        response.headers[NEXT_CURSOR_HEADER] = page.cursor
+    return response
+
+
+# модель сериализуется в ручке, а не в FastAPI после неё: время попадает
+# в стадию serialization заголовка Server-Timing
+def model_response(
+        model: BaseModel,
+        headers: Optional[Mapping[str, str]] = None
+        ) -> JSONBytesResponse:
+    with timed(SERIALIZATION):
+        body = orjson.dumps(model.dict())
+    return JSONBytesResponse(body, headers=headers)
@@ -0,0 +1,26 @@
+""" Приложение для бенчмарков под gunicorn: Elasticsearch и Redis в памяти
+
+У каждого воркера свои FakeElasticsearch и FakeRedis: кэш не делится
+между воркерами, как с CACHE_BACKEND=memory. Задержки сети, секунды:
+BENCHMARK_ES_LATENCY и BENCHMARK_REDIS_LATENCY.
+
+Запуск из src: gunicorn benchmarks.app:app -c gunicorn.conf.py
+"""
+import os
+
+from benchmarks.fake_elastic import FakeElasticsearch
+from benchmarks.fake_redis import FakeRedis
+from db import elastic, redis
+
+# блокировка в redis не поддерживается FakeRedis
+os.environ['CACHE_SINGLE_FLIGHT'] = 'local'
+os.environ['CACHE_WARMUP_ENABLED'] = 'false'
+
+ES_LATENCY = float(os.getenv('BENCHMARK_ES_LATENCY', '0.002'))
+REDIS_LATENCY = float(os.getenv('BENCHMARK_REDIS_LATENCY', '0.0002'))
+
+# клиенты создаются в main.startup, то есть уже в воркере
+redis.create_redis = lambda settings: FakeRedis(REDIS_LATENCY)
+elastic.create_elastic = lambda settings: FakeElasticsearch(ES_LATENCY)
+
+from main import app  # noqa: E402,F401
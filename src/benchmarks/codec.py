@@ -0,0 +1,115 @@
+""" Бенчмарк форматов кэша: размер значений в redis и время (де)кодирования
+
+Значения строятся из data/index_*.json так же, как их кладут сервисы:
+фильм целиком, персона с фильмографией и страница списка фильмов.
+
+Запуск из src: python -m benchmarks.codec [threshold]
+"""
+from collections import defaultdict
+import os
+import sys
+import time
+from typing import Dict, List
+
+import orjson
+
+from core.config import BASE_DIR
+from models.movie import Movie
+from schemas.movie_short import MovieShort
+from schemas.person import Person
+from services.cache.codec import ALGORITHMS, Codec
+
+DATA_DIR = os.path.join(os.path.dirname(BASE_DIR), 'data')
+ROLES = ('actors', 'directors', 'writers')
+PAGE_SIZE = 50
+REPEAT = 5
+
+
+def load_index(name: str) -> List[dict]:
+    with open(os.path.join(DATA_DIR, 'index_{0}.json'.format(name))) as f:
+        return [orjson.loads(line)['_source'] for line in f if line.strip()]
+
+
+def payloads() -> Dict[str, List[bytes]]:
+    movies = load_index('movies')
+    persons = load_index('person')
+    movie_by_person = defaultdict(lambda: defaultdict(list))
+    for movie in movies:
+        for role in ROLES:
+            for person in movie.get(role) or []:
+                movie_by_person[person['id']][movie['id']].append(role)
+    shorts = [
+        MovieShort(
+            uuid=movie['id'],
+            imdb_rating=movie.get('imdb_rating'),
+            title=movie['title']
+            ).dict()
+        for movie in movies
+        ]
+    return {
+        'movie': [Movie(**movie).json().encode() for movie in movies],
+        'person': [
+            Person(
+                uuid=person['id'],
+                full_name=person['full_name'],
+                movies=[
+                    {'uuid': id, 'roles': roles}
+                    for id, roles in movie_by_person[person['id']].items()
+                    ]
+                ).json().encode()
+            for person in persons
+            ],
+        'page': [
+            orjson.dumps(shorts[i:i + PAGE_SIZE])
+            for i in range(0, len(shorts), PAGE_SIZE)
+            ],
+    }
+
+
+def measure(codec: Codec, values: List[bytes]) -> dict:
+    encoded = [codec.encode(value) for value in values]
+    started = time.perf_counter()
+    for _ in range(REPEAT):
+        for value in values:
+            codec.encode(value)
+    encode = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(REPEAT):
+        for value in encoded:
+            codec.decode(value)
+    decode = time.perf_counter() - started
+    count = len(values) * REPEAT
+    return {
+        'raw': sum(map(len, values)),
+        'stored': sum(map(len, encoded)),
+        'encode_us': encode / count * 1e6,
+        'decode_us': decode / count * 1e6,
+    }
+
+
+def main(threshold: int):
+    data = payloads()
+    print('{0:<8}{1:<6}{2:>8}{3:>12}{4:>12}{5:>8}{6:>11}{7:>11}'.format(
+        'value', 'codec', 'count', 'raw, B', 'stored, B', 'ratio',
+        'encode, us', 'decode, us'
+        ))
+    for name, values in data.items():
+        for algorithm in ['none'] + list(ALGORITHMS):
+            result = measure(Codec(algorithm, threshold), values)
+            print(
+                '{0:<8}{1:<6}{2:>8}{3:>12}{4:>12}{5:>8.2f}'
+                '{6:>11.1f}{7:>11.1f}'.format(
+                    name,
+                    algorithm,
+                    len(values),
+                    result['raw'],
+                    result['stored'],
+                    result['stored'] / result['raw'],
+                    result['encode_us'],
+                    result['decode_us']
+                    )
+                )
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 512)
@@ -0,0 +1,309 @@
+""" Elasticsearch для бенчмарков: индексы из data/index_*.json в памяти
+
+Понимает только те запросы, которые строят services/query_to_es:
+bool, nested с inner_hits, term(s), match, match_phrase, multi_match,
+сортировку с search_after, from/size и фильтрацию _source.
+Релевантность - число найденных слов запроса с учётом веса поля.
+"""
+import asyncio
+import os
+from typing import Dict, List, Optional, Tuple
+
+from elasticsearch import NotFoundError
+import orjson
+
+from core.config import BASE_DIR
+
+DATA_DIR = os.path.join(os.path.dirname(BASE_DIR), 'data')
+INDICES = {
+    'movies': 'index_movies.json',
+    'person': 'index_person.json',
+    'genres': 'index_genres.json',
+}
+DEFAULT_SIZE = 10
+DEFAULT_INNER_HITS_SIZE = 3
+
+
+def load_index(name: str) -> Dict[str, dict]:
+    docs = {}
+    with open(os.path.join(DATA_DIR, INDICES[name]), 'rb') as f:
+        for line in f:
+            if line.strip():
+                doc = orjson.loads(line)
+                docs[doc['_id']] = doc['_source']
+    return docs
+
+
+def field_values(source: dict, path: str) -> list:
+    values = [source]
+    for part in path.split('.'):
+        found = []
+        for value in values:
+            if isinstance(value, dict) and part in value:
+                value = value[part]
+                found.extend(value if isinstance(value, list) else [value])
+        values = found
+    return values
+
+
+def filter_source(source: dict, spec):
+    if spec is None or spec is True:
+        return source
+    if spec is False:
+        return None
+    if isinstance(spec, str):
+        spec = [spec]
+    filtered = {}
+    for path in spec:
+        top, _, rest = path.partition('.')
+        if top not in source:
+            continue
+        value = source[top]
+        if not rest:
+            filtered[top] = value
+        elif isinstance(value, list):
+            filtered[top] = [filter_source(item, [rest]) for item in value]
+        elif isinstance(value, dict):
+            filtered[top] = filter_source(value, [rest])
+    return filtered
+
+
+class FakeElasticsearch:
+    """Замена AsyncElasticsearch; latency - задержка сети на запрос, с."""
+
+    def __init__(self, latency: float = 0):
+        self.latency = latency
+        self.indices = {name: load_index(name) for name in INDICES}
+        self.requests = 0
+
+    async def ping(self, **kwargs) -> bool:
+        return True
+
+    async def close(self):
+        pass
+
+    async def get(self, index: str, id: str, **kwargs) -> dict:
+        await self._request()
+        source = self.indices[index].get(id)
+        if source is None:
+            raise NotFoundError(404, 'not_found', {'_id': id})
+        return {
+            '_index': index,
+            '_id': id,
+            'found': True,
+            '_source': filter_source(source, kwargs.get('_source')),
+        }
+
+    async def mget(self, body: dict, index: str, **kwargs) -> dict:
+        await self._request()
+        docs = []
+        for id in body['ids']:
+            source = self.indices[index].get(id)
+            if source is None:
+                docs.append({'_index': index, '_id': id, 'found': False})
+            else:
+                docs.append({
+                    '_index': index,
+                    '_id': id,
+                    'found': True,
+                    '_source': filter_source(source, body.get('_source')),
+                })
+        return {'docs': docs}
+
+    async def search(
+            self,
+            index: str,
+            body: Optional[dict] = None,
+            size: Optional[int] = None,
+            **kwargs
+            ) -> dict:
+        await self._request()
+        body = body or {}
+        hits = []
+        for id, source in self.indices[index].items():
+            matched, score, inner_hits = self._match(
+                body.get('query'),
+                source
+                )
+            if not matched:
+                continue
+            hit = {'_index': index, '_id': id, '_score': score}
+            if inner_hits:
+                hit['inner_hits'] = inner_hits
+            hits.append((hit, source))
+
+        sort = self._sort_spec(body.get('sort'))
+        for field, order in reversed(sort):
+            hits.sort(
+                key=lambda item: self._sort_value(item, field, order),
+                reverse=order == 'desc'
+                )
+        total = len(hits)
+        search_after = body.get('search_after')
+        if search_after is not None:
+            hits = [
+                item for item in hits
+                if self._is_after(item, sort, search_after)
+                ]
+        start = int(body.get('from', 0))
+        if size is None:
+            size = DEFAULT_SIZE
+        size = int(body.get('size', size))
+
+        page = []
+        for hit, source in hits[start:start + size]:
+            hit = dict(hit)
+            if sort:
+                hit['sort'] = [
+                    self._sort_value((hit, source), field, order)
+                    for field, order in sort
+                    ]
+            source = filter_source(source, body.get('_source'))
+            if source is not None:
+                hit['_source'] = source
+            page.append(hit)
+        return {'hits': {'total': {'value': total}, 'hits': page}}
+
+    async def _request(self):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+
+    # (совпал ли документ, релевантность, inner_hits)
+    def _match(
+            self,
+            query: Optional[dict],
+            source: dict
+            ) -> Tuple[bool, float, dict]:
+        if not query or 'match_all' in query:
+            return True, 1.0, {}
+        if 'bool' in query:
+            return self._match_bool(query['bool'], source)
+        if 'nested' in query:
+            return self._match_nested(query['nested'], source)
+        if 'multi_match' in query:
+            spec = query['multi_match']
+            score = 0.0
+            for field in spec['fields']:
+                field, _, boost = field.partition('^')
+                score += self._text_score(
+                    spec['query'],
+                    field_values(source, field.replace('.raw', ''))
+                    ) * float(boost or 1)
+            return score > 0, score, {}
+        for kind in ('term', 'terms', 'match_phrase', 'match'):
+            if kind in query:
+                field, value = next(iter(query[kind].items()))
+                if isinstance(value, dict):
+                    value = value.get('value', value.get('query'))
+                values = field_values(source, field)
+                if kind == 'terms':
+                    wanted = {str(item) for item in value}
+                    matched = any(str(item) in wanted for item in values)
+                elif kind == 'match':
+                    score = self._text_score(value, values)
+                    return score > 0, score, {}
+                else:
+                    matched = str(value) in [str(item) for item in values]
+                return matched, 1.0 if matched else 0.0, {}
+        raise NotImplementedError(query)
+
+    def _match_bool(
+            self,
+            spec: dict,
+            source: dict
+            ) -> Tuple[bool, float, dict]:
+        score = 0.0
+        inner_hits = {}
+        for query in spec.get('must', []) + spec.get('filter', []):
+            matched, query_score, query_hits = self._match(query, source)
+            if not matched:
+                return False, 0.0, {}
+            score += query_score
+            inner_hits.update(query_hits)
+        should = spec.get('should', [])
+        matched_should = 0
+        for query in should:
+            matched, query_score, query_hits = self._match(query, source)
+            if matched:
+                matched_should += 1
+                score += query_score
+                inner_hits.update(query_hits)
+        if should and matched_should < spec.get('minimum_should_match', 1):
+            return False, 0.0, {}
+        return True, score, inner_hits
+
+    def _match_nested(
+            self,
+            spec: dict,
+            source: dict
+            ) -> Tuple[bool, float, dict]:
+        path = spec['path']
+        found = [
+            item for item in source.get(path) or []
+            if self._match(spec['query'], {path: item})[0]
+            ]
+        if not found:
+            return False, 0.0, {}
+        inner_hits = {}
+        if 'inner_hits' in spec:
+            options = spec['inner_hits']
+            # _source вложенных документов задаётся полным путём
+            fields = options.get('_source', True)
+            if isinstance(fields, list):
+                fields = [field.split('.', 1)[1] for field in fields]
+            inner_hits[options.get('name', path)] = {'hits': {
+                'total': {'value': len(found)},
+                'hits': [
+                    {'_source': filter_source(item, fields)}
+                    for item in found[:options.get(
+                        'size',
+                        DEFAULT_INNER_HITS_SIZE
+                        )]
+                    ],
+            }}
+        return True, 1.0, inner_hits
+
+    @staticmethod
+    def _text_score(query, values: list) -> float:
+        text = ' '.join(str(value) for value in values).casefold()
+        words = str(query).casefold().split()
+        return float(sum(word in text for word in words))
+
+    @staticmethod
+    def _sort_spec(sort) -> List[Tuple[str, str]]:
+        spec = []
+        for item in sort or []:
+            if isinstance(item, str):
+                spec.append((item, 'asc'))
+                continue
+            field, options = next(iter(item.items()))
+            order = options.get('order', 'asc') if isinstance(options, dict) \
+                else options
+            spec.append((field, order))
+        return spec
+
+    @staticmethod
+    def _sort_value(item, field: str, order: str):
+        hit, source = item
+        if field == '_score':
+            return hit['_score']
+        values = field_values(source, field.replace('.raw', ''))
+        if not values or values[0] is None:
+            # документы без значения - в конце выдачи при любом порядке
+            return float('-inf') if order == 'desc' else float('inf')
+        return values[0]
+
+    def _is_after(
+            self,
+            item,
+            sort: List[Tuple[str, str]],
+            after: list
+            ) -> bool:
+        for (field, order), last in zip(sort, after):
+            value = self._sort_value(item, field, order)
+            if isinstance(last, str) and last in ('Infinity', '-Infinity'):
+                last = float(last)
+            if value == last:
+                continue
+            return value > last if order == 'asc' else value < last
+        return False
@@ -0,0 +1,121 @@
+""" Redis для бенчмарков: словарь в памяти с TTL и задержкой сети
+
+Реализует только то, чем пользуется RedisStore (db/store.py): pipeline без
+транзакции с MGET, SET EX, INCR и EXPIRE NX. Одиночная блокировка redis
+(CACHE_SINGLE_FLIGHT=redis) не поддерживается.
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+from redis.exceptions import DataError
+
+
+class FakeRedis:
+    """latency - задержка одного похода в redis, секунды."""
+
+    def __init__(self, latency: float = 0):
+        self.latency = latency
+        self._data: Dict[str, Tuple[bytes, float]] = {}
+        self.round_trips = 0
+
+    async def ping(self) -> bool:
+        await self._round_trip()
+        return True
+
+    async def close(self, close_connection_pool: Optional[bool] = None):
+        pass
+
+    def pipeline(self, transaction: bool = True) -> 'FakePipeline':
+        return FakePipeline(self)
+
+    async def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        await self._round_trip()
+        return self._mget(keys)
+
+    async def set(self, key: str, value, ex: Optional[int] = None):
+        _check_ex(ex)
+        await self._round_trip()
+        self._set(key, value, ex)
+
+    async def incr(self, key: str) -> int:
+        await self._round_trip()
+        return self._incr(key)
+
+    async def expire(self, key: str, seconds: int, nx: bool = False) -> bool:
+        await self._round_trip()
+        return self._expire(key, seconds, nx)
+
+    # суммарный размер живых значений, байты
+    def memory(self) -> int:
+        return sum(len(self._get(key) or b'') for key in list(self._data))
+
+    async def _round_trip(self):
+        self.round_trips += 1
+        await asyncio.sleep(self.latency)
+
+    def _get(self, key: str) -> Optional[bytes]:
+        value, expire_at = self._data.get(key, (None, 0))
+        if value is not None and expire_at and expire_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def _mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        return [self._get(key) for key in keys]
+
+    def _set(self, key: str, value, ex: Optional[int] = None):
+        if isinstance(value, str):
+            value = value.encode()
+        expire_at = time.monotonic() + ex if ex else 0
+        self._data[key] = (value, expire_at)
+
+    def _incr(self, key: str) -> int:
+        value = int(self._get(key) or 0) + 1
+        _, expire_at = self._data.get(key, (None, 0))
+        self._data[key] = (str(value).encode(), expire_at)
+        return value
+
+    def _expire(self, key: str, seconds: int, nx: bool = False) -> bool:
+        value = self._get(key)
+        if value is None or nx and self._data[key][1]:
+            return False
+        self._data[key] = (value, time.monotonic() + seconds)
+        return True
+
+
+class FakePipeline:
+
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self._commands = []
+
+    async def __aenter__(self) -> 'FakePipeline':
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._commands = []
+
+    def mget(self, keys: List[str]):
+        self._commands.append((self.redis._mget, (keys,)))
+
+    def set(self, key: str, value, ex: Optional[int] = None):
+        _check_ex(ex)
+        self._commands.append((self.redis._set, (key, value, ex)))
+
+    def incr(self, key: str):
+        self._commands.append((self.redis._incr, (key,)))
+
+    def expire(self, key: str, seconds: int, nx: bool = False):
+        self._commands.append((self.redis._expire, (key, seconds, nx)))
+
+    async def execute(self) -> list:
+        await self.redis._round_trip()
+        commands, self._commands = self._commands, []
+        return [command(*args) for command, args in commands]
+
+
+# как redis-py: EX с float не уходит в redis, ошибка при добавлении команды
+def _check_ex(ex: Optional[int]):
+    if ex is not None and not isinstance(ex, int):
+        raise DataError('ex must be datetime.timedelta or int')
@@ -0,0 +1,196 @@
+""" Бенчмарк API: приложение целиком против Elasticsearch и Redis в памяти
+
+Запросы из файла (по строке JSON {"endpoint": ..., "path": ...})
+прогоняются дважды: с пустым кэшем (cold) и повторно (warm). Для
+каждого прогона выводятся пропускная способность и p50/p95/p99 по
+каждому эндпоинту.
+
+Запуск из src: python -m benchmarks.run [--concurrency 10] ...
+"""
+import argparse
+import asyncio
+from collections import defaultdict
+import logging
+import os
+import time
+from typing import Dict, List, NamedTuple, Tuple
+from urllib.parse import unquote
+
+import orjson
+
+from benchmarks.fake_elastic import FakeElasticsearch
+from benchmarks.fake_redis import FakeRedis
+from db import elastic, redis
+
+REQUESTS_FILE = os.path.join(os.path.dirname(__file__), 'requests.jsonl')
+PERCENTILES = (50, 95, 99)
+
+
+class Result(NamedTuple):
+    endpoint: str
+    status: int
+    seconds: float
+
+
+def load_requests(path: str) -> List[Tuple[str, str]]:
+    with open(path, 'rb') as f:
+        lines = [orjson.loads(line) for line in f if line.strip()]
+    return [(line['endpoint'], line['path']) for line in lines]
+
+
+async def call(app, path: str) -> int:
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': unquote(path),
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'benchmark')],
+        'client': ('127.0.0.1', 0),
+        'server': ('benchmark', 80),
+    }
+    response = {}
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+
+    await app(scope, receive, send)
+    return response['status']
+
+
+async def replay(
+        app,
+        requests: List[Tuple[str, str]],
+        concurrency: int
+        ) -> Tuple[List[Result], float]:
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+    results = []
+
+    async def worker():
+        while not queue.empty():
+            endpoint, path = queue.get_nowait()
+            started = time.perf_counter()
+            status = await call(app, path)
+            results.append(Result(
+                endpoint,
+                status,
+                time.perf_counter() - started
+                ))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results, time.perf_counter() - started
+
+
+def percentile(values: List[float], percent: int) -> float:
+    values = sorted(values)
+    index = max(0, -(-len(values) * percent // 100) - 1)
+    return values[index]
+
+
+def report(phase: str, results: List[Result], seconds: float):
+    by_endpoint: Dict[str, List[Result]] = defaultdict(list)
+    for result in results:
+        by_endpoint[result.endpoint].append(result)
+    by_endpoint = dict(sorted(by_endpoint.items()))
+    by_endpoint['total'] = results
+    print('\n{0}: {1} requests in {2:.2f} s, {3:.0f} req/s'.format(
+        phase,
+        len(results),
+        seconds,
+        len(results) / seconds
+        ))
+    print('{0:<22}{1:>7}{2:>8}{3:>10}{4:>10}{5:>10}'.format(
+        'endpoint', 'count', 'errors', 'p50, ms', 'p95, ms', 'p99, ms'
+        ))
+    for endpoint, items in by_endpoint.items():
+        latencies = [item.seconds * 1000 for item in items]
+        errors = sum(item.status >= 500 for item in items)
+        print('{0:<22}{1:>7}{2:>8}{3:>10.2f}{4:>10.2f}{5:>10.2f}'.format(
+            endpoint,
+            len(items),
+            errors,
+            *(percentile(latencies, percent) for percent in PERCENTILES)
+            ))
+
+
+async def run(args):
+    # блокировка в redis не поддерживается FakeRedis
+    os.environ['CACHE_SINGLE_FLIGHT'] = 'local'
+    os.environ['CACHE_WARMUP_ENABLED'] = 'false'
+    os.environ['CATALOG_BACKEND'] = args.backend
+    os.environ['CACHE_BACKEND'] = args.cache
+    import main
+
+    logging.disable(logging.WARNING)
+    fake_redis = FakeRedis(args.redis_latency)
+    fake_elastic = FakeElasticsearch(args.es_latency)
+    redis.create_redis = lambda settings: fake_redis
+    elastic.create_elastic = lambda settings: fake_elastic
+
+    requests = load_requests(args.requests)
+    await main.app.router.startup()
+    try:
+        for phase in ('cold', 'warm'):
+            es_before = fake_elastic.requests
+            redis_before = fake_redis.round_trips
+            results, seconds = await replay(
+                main.app,
+                requests,
+                args.concurrency
+                )
+            report(phase, results, seconds)
+            print('ES requests: {0}, redis round trips: {1}, '
+                  'redis memory: {2} B'.format(
+                      fake_elastic.requests - es_before,
+                      fake_redis.round_trips - redis_before,
+                      fake_redis.memory()
+                      ))
+    finally:
+        await main.app.router.shutdown()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', default=REQUESTS_FILE)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument(
+        '--es-latency',
+        type=float,
+        default=0.002,
+        help='задержка запроса к Elasticsearch, с'
+        )
+    parser.add_argument(
+        '--redis-latency',
+        type=float,
+        default=0.0002,
+        help='задержка похода в Redis, с'
+        )
+    parser.add_argument(
+        '--backend',
+        choices=('elastic', 'memory'),
+        default='elastic',
+        help='источник документов при промахе кэша (CATALOG_BACKEND)'
+        )
+    parser.add_argument(
+        '--cache',
+        choices=('redis', 'memory'),
+        default='redis',
+        help='хранилище кэша (CACHE_BACKEND), memory - без FakeRedis'
+        )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,187 @@
+""" Масштабирование по воркерам: gunicorn с 1..N воркерами под нагрузкой
+
+Для каждого числа воркеров поднимается gunicorn с benchmarks.app
+(gunicorn.conf.py, Elasticsearch и Redis в памяти каждого воркера).
+Запросы из requests.jsonl идут по кругу duration секунд с concurrency
+соединениями из clients процессов. Первые warmup секунд прогревают кэши
+воркеров и не учитываются.
+
+Клиенты делят ядра с воркерами: на машине с k ядрами рост
+ожидаем примерно до k - clients воркеров.
+
+Запуск из src: python -m benchmarks.scaling --workers 1 2 4 [--backend memory]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+import aiohttp
+
+from benchmarks.run import REQUESTS_FILE, load_requests, percentile
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+READY_TIMEOUT = 60
+
+
+async def _load(
+        url: str,
+        paths: List[str],
+        connections: int,
+        seconds: float
+        ) -> Tuple[List[float], int]:
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    connector = aiohttp.TCPConnector(limit=connections)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+
+        async def connection(offset: int):
+            nonlocal errors
+            i = offset
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    async with session.get(url + paths[i % len(paths)]) as r:
+                        await r.read()
+                        if r.status >= 500:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+                i += 1
+
+        await asyncio.gather(*(
+            connection(offset * len(paths) // connections)
+            for offset in range(connections)
+            ))
+    return latencies, errors
+
+
+def _client(args) -> Tuple[List[float], int]:
+    return asyncio.run(_load(*args))
+
+
+def load(
+        url: str,
+        paths: List[str],
+        concurrency: int,
+        clients: int,
+        seconds: float
+        ) -> Tuple[List[float], int]:
+    connections = max(1, concurrency // clients)
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.map(
+            _client,
+            [(url, paths, connections, seconds)] * clients
+            )
+    latencies = [latency for found, _ in results for latency in found]
+    return latencies, sum(errors for _, errors in results)
+
+
+def start_server(workers: int, port: int, backend: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        SERVER_WORKERS=str(workers),
+        SERVER_BIND='127.0.0.1:{0}'.format(port),
+        CATALOG_BACKEND=backend,
+        CACHE_WARMUP_ENABLED='false',
+        LOG_ROOT_LEVEL='WARNING',
+        LOG_LOGGER_LEVEL='WARNING',
+        )
+    return subprocess.Popen(
+        [
+            sys.executable, '-m', 'gunicorn', 'benchmarks.app:app',
+            '--config', 'gunicorn.conf.py'
+            ],
+        cwd=SRC_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+        )
+
+
+async def wait_ready(url: str):
+    deadline = time.monotonic() + READY_TIMEOUT
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url + '/metrics') as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit('gunicorn is not ready at {0}'.format(url))
+
+
+def run(args):
+    paths = [path for _, path in load_requests(args.requests)]
+    url = 'http://127.0.0.1:{0}'.format(args.port)
+    print('{0:>8}{1:>10}{2:>10}{3:>10}{4:>8}{5:>9}'.format(
+        'workers', 'req/s', 'p50, ms', 'p99, ms', 'errors', 'speedup'
+        ))
+    base = None
+    for workers in args.workers:
+        server = start_server(workers, args.port, args.backend)
+        try:
+            asyncio.run(wait_ready(url))
+            load(url, paths, args.concurrency, args.clients, args.warmup)
+            latencies, errors = load(
+                url,
+                paths,
+                args.concurrency,
+                args.clients,
+                args.duration
+                )
+        finally:
+            server.terminate()
+            server.wait()
+        rate = len(latencies) / args.duration
+        base = base or rate
+        print('{0:>8}{1:>10.0f}{2:>10.2f}{3:>10.2f}{4:>8}{5:>9.2f}'.format(
+            workers,
+            rate,
+            percentile(latencies, 50) * 1000,
+            percentile(latencies, 99) * 1000,
+            errors,
+            rate / base
+            ))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--workers',
+        type=int,
+        nargs='+',
+        default=[1, 2, 4],
+        help='числа воркеров gunicorn'
+        )
+    parser.add_argument('--requests', default=REQUESTS_FILE)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument(
+        '--clients',
+        type=int,
+        default=2,
+        help='процессов, создающих нагрузку'
+        )
+    parser.add_argument('--duration', type=float, default=10, help='с')
+    parser.add_argument('--warmup', type=float, default=3, help='с')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument(
+        '--backend',
+        choices=('elastic', 'memory'),
+        default='elastic',
+        help='источник документов при промахе кэша (CATALOG_BACKEND)'
+        )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    run(parse_args())
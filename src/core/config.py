@@ -1,4 +1,5 @@
 import os
+from typing import List
 
 from pydantic import BaseSettings, Field
 
@@ -10,10 +11,39 @@ PROJECT_NAME = os.getenv('PROJECT_NAME', 'movies')
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
+class ServerSettings(BaseSettings):
+    # gunicorn (gunicorn.conf.py): адрес и число воркеров, 0 - по ядрам
+    SERVER_BIND: str = Field('0.0.0.0:8000', env='SERVER_BIND')
+    SERVER_WORKERS: int = Field(0, env='SERVER_WORKERS')
+    # цикл событий (auto | uvloop | asyncio) и парсер HTTP (auto |
+    # httptools | h11) воркера uvicorn, auto - uvloop и httptools,
+    # если установлены
+    SERVER_LOOP: str = Field('auto', env='SERVER_LOOP')
+    SERVER_HTTP: str = Field('auto', env='SERVER_HTTP')
+    # приложение импортируется в мастере до fork
+    SERVER_PRELOAD: bool = Field(True, env='SERVER_PRELOAD')
+    # keep-alive соединения и таймаут ответа воркера, секунды
+    SERVER_KEEPALIVE: int = Field(5, env='SERVER_KEEPALIVE')
+    SERVER_TIMEOUT: int = Field(30, env='SERVER_TIMEOUT')
+
+    class Config:
+        env_file = '.env.settings'
+        env_file_encoding = 'utf-8'
+
+
 class LogSettings(BaseSettings):
     LOG_LOGGER_LEVEL: str = Field('INFO', env='LOG_LOGGER_LEVEL')
     LOG_ROOT_LEVEL: str = Field('INFO', env='LOG_ROOT_LEVEL')
     LOG_HANDLERS_LEVEL: str = Field('DEBUG', env='LOG_HANDLERS_LEVEL')
+    # запись в stdout из фонового потока, а не из цикла событий
+    LOG_QUEUE_ENABLED: bool = Field(True, env='LOG_QUEUE_ENABLED')
+    # записи сверх очереди отбрасываются, а не блокируют запрос
+    LOG_QUEUE_SIZE: int = Field(10000, env='LOG_QUEUE_SIZE')
+    # доля сообщений о попаданиях и промахах кэша (логгер cache)
+    LOG_CACHE_SAMPLE_RATE: float = Field(
+        0.01,
+        env='LOG_CACHE_SAMPLE_RATE'
+        )
 
     class Config:
         env_file = '.env.settings'
@@ -23,6 +53,19 @@ class LogSettings(BaseSettings):
 class RedisSettings(BaseSettings):
     REDIS_HOST: str = Field('127.0.0.1', env='REDIS_HOST')
     REDIS_PORT: int = Field(6379, env='REDIS_PORT')
+    # соединений в пуле одного воркера и сколько ждать свободного, секунды
+    REDIS_MAX_CONNECTIONS: int = Field(50, env='REDIS_MAX_CONNECTIONS')
+    REDIS_POOL_TIMEOUT: float = Field(5, env='REDIS_POOL_TIMEOUT')
+    REDIS_SOCKET_KEEPALIVE: bool = Field(True, env='REDIS_SOCKET_KEEPALIVE')
+    # таймауты соединения и ответа, секунды
+    REDIS_CONNECT_TIMEOUT: float = Field(2, env='REDIS_CONNECT_TIMEOUT')
+    REDIS_READ_TIMEOUT: float = Field(2, env='REDIS_READ_TIMEOUT')
+    REDIS_RETRY_ON_TIMEOUT: bool = Field(True, env='REDIS_RETRY_ON_TIMEOUT')
+    # проверка простаивающего соединения перед использованием, секунды
+    REDIS_HEALTH_CHECK_INTERVAL: int = Field(
+        30,
+        env='REDIS_HEALTH_CHECK_INTERVAL'
+        )
 
     class Config:
         env_file = '.env.redis'
@@ -32,7 +75,101 @@ class RedisSettings(BaseSettings):
 class ElasticSettings(BaseSettings):
     ELASTIC_HOST: str = Field('127.0.0.1', env='ELASTIC_HOST')
     ELASTIC_PORT: int = Field(9200, env='ELASTIC_PORT')
+    # соединений keep-alive к узлу в одном воркере
+    ELASTIC_MAX_CONNECTIONS: int = Field(25, env='ELASTIC_MAX_CONNECTIONS')
+    # таймаут запроса, секунды
+    ELASTIC_TIMEOUT: float = Field(5, env='ELASTIC_TIMEOUT')
+    ELASTIC_MAX_RETRIES: int = Field(2, env='ELASTIC_MAX_RETRIES')
+    ELASTIC_RETRY_ON_TIMEOUT: bool = Field(
+        True,
+        env='ELASTIC_RETRY_ON_TIMEOUT'
+        )
+    # gzip тела запроса
+    ELASTIC_HTTP_COMPRESS: bool = Field(True, env='ELASTIC_HTTP_COMPRESS')
+    # search - роли персоны ищутся по индексу movies,
+    # materialized - берутся из документа person (etl/person_movies.py)
+    ELASTIC_PERSON_MOVIES: str = Field('search', env='ELASTIC_PERSON_MOVIES')
 
     class Config:
         env_file = '.env.elastic'
         env_file_encoding = 'utf-8'
+
+
+class CatalogSettings(BaseSettings):
+    # elastic - документы в ES, memory - каталог в памяти воркера
+    # из дампов data/index_*.json (db/storage.py), поиск остаётся за ES
+    CATALOG_BACKEND: str = Field('elastic', env='CATALOG_BACKEND')
+    CATALOG_DATA_DIR: str = Field(
+        os.path.join(os.path.dirname(BASE_DIR), 'data'),
+        env='CATALOG_DATA_DIR'
+        )
+
+    class Config:
+        env_file = '.env.settings'
+        env_file_encoding = 'utf-8'
+
+
+class CacheSettings(BaseSettings):
+    # redis - кэш общий для воркеров, memory - свой у каждого воркера,
+    # без redis (db/store.py)
+    CACHE_BACKEND: str = Field('redis', env='CACHE_BACKEND')
+    CACHE_MEMORY_MAX_ITEMS: int = Field(
+        100000,
+        env='CACHE_MEMORY_MAX_ITEMS'
+        )
+    CACHE_MEMORY_MAX_BYTES: int = Field(
+        256 * 1024 * 1024,
+        env='CACHE_MEMORY_MAX_BYTES'
+        )
+    # local - промахи склеиваются внутри воркера,
+    # redis - ещё и между воркерами через блокировку в redis
+    CACHE_SINGLE_FLIGHT: str = Field('local', env='CACHE_SINGLE_FLIGHT')
+    # время жизни блокировки и сколько её ждать, секунды
+    CACHE_LOCK_TIMEOUT: float = Field(10, env='CACHE_LOCK_TIMEOUT')
+    CACHE_LOCK_WAIT: float = Field(5, env='CACHE_LOCK_WAIT')
+    # L1-кэш в памяти воркера перед redis
+    CACHE_L1_ENABLED: bool = Field(True, env='CACHE_L1_ENABLED')
+    CACHE_L1_MAX_ITEMS: int = Field(10000, env='CACHE_L1_MAX_ITEMS')
+    CACHE_L1_MAX_BYTES: int = Field(64 * 1024 * 1024, env='CACHE_L1_MAX_BYTES')
+    # TTL записи в L1 = TTL сервиса, но не больше этого значения, секунды
+    CACHE_L1_MAX_TTL: float = Field(60, env='CACHE_L1_MAX_TTL')
+    # сжатие значений в redis: auto | none | zlib | lz4 | zstd;
+    # auto - lz4, если он установлен, иначе без сжатия
+    CACHE_CODEC: str = Field('auto', env='CACHE_CODEC')
+    # значения короче порога сохраняются без сжатия, байты
+    CACHE_CODEC_THRESHOLD: int = Field(512, env='CACHE_CODEC_THRESHOLD')
+    # сколько воркер помнит версии пространств ключей, секунды
+    CACHE_VERSION_TTL: float = Field(5, env='CACHE_VERSION_TTL')
+    # страницы главной отдаются устаревшими и обновляются в фоне
+    CACHE_SWR_ENABLED: bool = Field(True, env='CACHE_SWR_ENABLED')
+    # популярность поиска: каждые CACHE_POPULARITY_STEP запросов за окно
+    # удваивают TTL ответа до CACHE_POPULARITY_MAX_TTL, 0 - выключено;
+    # окно не короче CACHE_POPULARITY_MAX_TTL
+    CACHE_POPULARITY_STEP: int = Field(10, env='CACHE_POPULARITY_STEP')
+    CACHE_POPULARITY_WINDOW: float = Field(
+        24 * 60 * 60,
+        env='CACHE_POPULARITY_WINDOW'
+        )
+    CACHE_POPULARITY_MAX_TTL: int = Field(
+        24 * 60 * 60,
+        env='CACHE_POPULARITY_MAX_TTL'
+        )
+    # прогрев при старте: список жанров и первые страницы главной
+    # для каждой сортировки и каждого жанра
+    CACHE_WARMUP_ENABLED: bool = Field(False, env='CACHE_WARMUP_ENABLED')
+    CACHE_WARMUP_PAGES: int = Field(3, env='CACHE_WARMUP_PAGES')
+    CACHE_WARMUP_PAGE_SIZE: int = Field(50, env='CACHE_WARMUP_PAGE_SIZE')
+    # JSON-список, например ["-imdb_rating", "+imdb_rating"]
+    CACHE_WARMUP_SORTS: List[str] = Field(
+        ['-imdb_rating'],
+        env='CACHE_WARMUP_SORTS'
+        )
+    # одновременных запросов прогрева к ES
+    CACHE_WARMUP_CONCURRENCY: int = Field(
+        4,
+        env='CACHE_WARMUP_CONCURRENCY'
+        )
+
+    class Config:
+        env_file = '.env.settings'
+        env_file_encoding = 'utf-8'
@@ -1,10 +1,35 @@
 import logging
+import logging.config
 from functools import lru_cache
+from typing import Optional
 
-from core.logger import LOGGING
+from core.logger import (
+    CACHE_LOGGER,
+    LOGGING,
+    SamplingAdapter,
+    log_settings,
+    use_queue
+    )
 
 
 @lru_cache()
-def get_logger():
+def setup_logging():
     logging.config.dictConfig(LOGGING)
-    return logging.getLogger()
+    if not log_settings.LOG_QUEUE_ENABLED:
+        return
+    # у access-логов uvicorn свой обработчик: своя очередь и поток
+    for logger in (logging.getLogger(), logging.getLogger('uvicorn.access')):
+        use_queue(logger)
+
+
+def get_logger(name: Optional[str] = None):
+    setup_logging()
+    return logging.getLogger(name)
+
+
+# попадания и промахи кэша пишутся с долей LOG_CACHE_SAMPLE_RATE
+def get_cache_logger() -> SamplingAdapter:
+    return SamplingAdapter(
+        get_logger(CACHE_LOGGER),
+        log_settings.LOG_CACHE_SAMPLE_RATE
+        )
@@ -1,10 +1,54 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from typing import List, Optional
+
 from core.config import LogSettings
 
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 LOG_DEFAULT_HANDLERS = ['console', ]
+# сообщения о попаданиях и промахах кэша на каждый запрос
+CACHE_LOGGER = 'cache'
 
 log_settings = LogSettings()
 
+
+class SamplingAdapter(logging.LoggerAdapter):
+    """Пишет долю rate сообщений уровня INFO и ниже: отброшенные
+    не создают LogRecord."""
+
+    def __init__(self, logger: logging.Logger, rate: float):
+        super().__init__(logger, {})
+        self.rate = rate
+
+    def log(self, level: int, msg, *args, **kwargs):
+        if level <= logging.INFO and random.random() >= self.rate:
+            return
+        super().log(level, msg, *args, **kwargs)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Кладёт записи в очередь без форматирования, при переполнении
+    отбрасывает их."""
+
+    dropped = 0
+    # поток, который разбирает очередь; после fork его заменяет новый
+    listener: Optional[logging.handlers.QueueListener] = None
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # сообщение форматирует поток QueueListener, а не цикл событий
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -60,3 +104,47 @@ LOGGING = {
         'handlers': LOG_DEFAULT_HANDLERS,
     },
 }
+
+
+def use_queue(logger: logging.Logger) -> logging.handlers.QueueListener:
+    """Переносит обработчики логгера в фоновый поток QueueListener.
+
+    Очередь дописывается в обработчики при остановке процесса.
+    """
+    handlers = logger.handlers
+    handler = DroppingQueueHandler(queue.Queue(log_settings.LOG_QUEUE_SIZE))
+    logger.handlers = [handler]
+    listener = _listen(handler, handlers)
+    # поток не переживает fork: воркеру gunicorn, импортировавшему
+    # приложение в мастере (SERVER_PRELOAD), нужны своя очередь и поток
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(
+            after_in_child=lambda: _restart(handler, handlers)
+            )
+    return listener
+
+
+def _listen(
+        handler: DroppingQueueHandler,
+        handlers: List[logging.Handler]
+        ) -> logging.handlers.QueueListener:
+    listener = logging.handlers.QueueListener(
+        handler.queue,
+        *handlers,
+        respect_handler_level=True
+        )
+    listener.start()
+    atexit.register(listener.stop)
+    handler.listener = listener
+    return listener
+
+
+def _restart(
+        handler: DroppingQueueHandler,
+        handlers: List[logging.Handler]
+        ):
+    # поток и блокировки старой очереди остались в мастере: новый
+    # слушатель с новой очередью, остановка старого при выходе не нужна
+    atexit.unregister(handler.listener.stop)
+    handler.queue = queue.Queue(log_settings.LOG_QUEUE_SIZE)
+    _listen(handler, handlers)
@@ -0,0 +1,238 @@
+""" Метрики в формате Prometheus и заголовок Server-Timing
+
+Метрики считаются в памяти воркера, /metrics отдаёт метрики того
+воркера, который обработал запрос.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import time
+from typing import Dict, List, Optional, Tuple
+
+from core.timing import start_request
+
+# секунды, как у prometheus_client по умолчанию
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._buckets: Dict[Labels, List[int]] = {}
+        self._sums: Dict[Labels, float] = defaultdict(float)
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        buckets = self._buckets.get(key)
+        if buckets is None:
+            buckets = self._buckets[key] = [0] * (len(BUCKETS) + 1)
+        buckets[bisect_left(BUCKETS, value)] += 1
+        self._sums[key] += value
+
+    def render(self) -> List[str]:
+        lines = [
+            '# HELP {0} {1}'.format(self.name, self.documentation),
+            '# TYPE {0} histogram'.format(self.name),
+            ]
+        for key, buckets in self._buckets.items():
+            count = 0
+            for bound, bucket in zip(BUCKETS + (float('inf'),), buckets):
+                count += bucket
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{0}_bucket{1} {2}'.format(
+                    self.name,
+                    _labels(key + (('le', le),)),
+                    count
+                    ))
+            lines.append('{0}_sum{1} {2}'.format(
+                self.name,
+                _labels(key),
+                self._sums[key]
+                ))
+            lines.append('{0}_count{1} {2}'.format(
+                self.name,
+                _labels(key),
+                count
+                ))
+        return lines
+
+
+class Counter:
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[Labels, float] = defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels: str):
+        self._values[tuple(sorted(labels.items()))] += amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self) -> List[str]:
+        lines = [
+            '# HELP {0} {1}'.format(self.name, self.documentation),
+            '# TYPE {0} counter'.format(self.name),
+            ]
+        for key, value in self._values.items():
+            lines.append('{0}{1} {2}'.format(self.name, _labels(key), value))
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds',
+    'Request duration by route and status'
+    )
+REQUEST_STAGE_DURATION = Histogram(
+    'http_request_stage_seconds',
+    'Time spent in redis, es, validation and serialization per request'
+    )
+CACHE_REQUESTS = Counter(
+    'cache_requests_total',
+    'Cache lookups by namespace and result (hit, miss)'
+    )
+
+
+# повторные чтения того же ключа (recheck в single-flight) не считаются:
+# промах запроса уже учтён первым чтением
+_uncounted: ContextVar[bool] = ContextVar('cache_uncounted', default=False)
+
+
+@contextmanager
+def uncounted():
+    token = _uncounted.set(True)
+    try:
+        yield
+    finally:
+        _uncounted.reset(token)
+
+
+def count_cache(namespace: str, hits: int, misses: int):
+    if _uncounted.get():
+        return
+    if hits:
+        CACHE_REQUESTS.inc(hits, namespace=namespace, result='hit')
+    if misses:
+        CACHE_REQUESTS.inc(misses, namespace=namespace, result='miss')
+
+
+def render(l1: Optional[Dict[str, int]] = None) -> str:
+    """l1 - LocalCache.stats() воркера: его попадания и промахи выводятся
+    в cache_requests_total и cache_hit_ratio как пространство l1.
+    """
+    lines = REQUEST_DURATION.render() + REQUEST_STAGE_DURATION.render()
+    lines += CACHE_REQUESTS.render()
+    lookups = {}
+    for key in CACHE_REQUESTS._values:
+        namespace = dict(key)['namespace']
+        lookups[namespace] = (
+            CACHE_REQUESTS.value(namespace=namespace, result='hit'),
+            CACHE_REQUESTS.value(namespace=namespace, result='miss')
+            )
+    if l1 is not None:
+        lookups['l1'] = (l1['hits'], l1['misses'])
+        for result, value in zip(('hit', 'miss'), lookups['l1']):
+            lines.append('{0}{1} {2}'.format(
+                CACHE_REQUESTS.name,
+                _labels((('namespace', 'l1'), ('result', result))),
+                value
+                ))
+    lines += [
+        '# HELP cache_hit_ratio Cache hits to lookups by namespace',
+        '# TYPE cache_hit_ratio gauge',
+        ]
+    for namespace, (hits, misses) in sorted(lookups.items()):
+        if hits + misses:
+            lines.append('cache_hit_ratio{0} {1}'.format(
+                _labels((('namespace', namespace),)),
+                hits / (hits + misses)
+                ))
+    if l1 is not None:
+        lines += _l1_lines(l1)
+    return '\n'.join(lines) + '\n'
+
+
+def _l1_lines(l1: Dict[str, int]) -> List[str]:
+    return [
+        '# HELP cache_l1_evictions_total L1 entries evicted by size limits',
+        '# TYPE cache_l1_evictions_total counter',
+        'cache_l1_evictions_total {0}'.format(l1['evictions']),
+        '# HELP cache_l1_items L1 entries in the worker',
+        '# TYPE cache_l1_items gauge',
+        'cache_l1_items {0}'.format(l1['items']),
+        '# HELP cache_l1_bytes L1 value bytes in the worker',
+        '# TYPE cache_l1_bytes gauge',
+        'cache_l1_bytes {0}'.format(l1['bytes']),
+        ]
+
+
+class TimingMiddleware:
+    """Время запроса по стадиям в Server-Timing и в гистограммы.
+
+    route - имя функции ручки, чтобы у метрик не было меток с id.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        timings = start_request()
+        started = time.perf_counter()
+        status = {'code': 500}
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+                total = time.perf_counter() - started
+                header = ', '.join(
+                    '{0};dur={1:.2f}'.format(stage, seconds * 1000)
+                    for stage, seconds in timings.stages.items()
+                    )
+                header += '{0}total;dur={1:.2f}'.format(
+                    ', ' if header else '',
+                    total * 1000
+                    )
+                message.setdefault('headers', [])
+                message['headers'] = list(message['headers']) + [
+                    (b'server-timing', header.encode())
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            route = _route(scope)
+            if route != 'metrics':
+                REQUEST_DURATION.observe(
+                    time.perf_counter() - started,
+                    route=route,
+                    status=str(status['code'])
+                    )
+                for stage, seconds in timings.stages.items():
+                    REQUEST_STAGE_DURATION.observe(
+                        seconds,
+                        route=route,
+                        stage=stage
+                        )
+
+
+def _route(scope) -> str:
+    endpoint = scope.get('endpoint')
+    return getattr(endpoint, '__name__', 'unmatched')
+
+
+def _labels(key: Labels) -> str:
+    if not key:
+        return ''
+    return '{' + ','.join(
+        '{0}="{1}"'.format(name, str(value).replace('"', '\\"'))
+        for name, value in key
+        ) + '}'
@@ -0,0 +1,51 @@
+""" Время запроса по стадиям: redis, es, validation, serialization
+
+Middleware (core/metrics.py) заводит на запрос RequestTimings в
+contextvar, сервисы и клиенты оборачивают свои участки в timed(stage).
+Вне запроса timed ничего не делает. Вложенные участки одной стадии
+(например, валидация вложенных моделей) считаются один раз.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import time
+from typing import Dict, Optional, Set
+
+REDIS = 'redis'
+ELASTIC = 'es'
+VALIDATION = 'validation'
+SERIALIZATION = 'serialization'
+
+
+class RequestTimings:
+
+    def __init__(self):
+        self.stages: Dict[str, float] = defaultdict(float)
+        self.active: Set[str] = set()
+
+
+_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    'request_timings',
+    default=None
+    )
+
+
+def start_request() -> RequestTimings:
+    timings = RequestTimings()
+    _timings.set(timings)
+    return timings
+
+
+@contextmanager
+def timed(stage: str):
+    timings = _timings.get()
+    if timings is None or stage in timings.active:
+        yield
+        return
+    timings.active.add(stage)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.active.discard(stage)
+        timings.stages[stage] += time.perf_counter() - started
@@ -0,0 +1,13 @@
+""" Воркер gunicorn: uvicorn с циклом событий и парсером HTTP из настроек """
+from uvicorn.workers import UvicornWorker
+
+from core.config import ServerSettings
+
+settings = ServerSettings()
+
+
+class Worker(UvicornWorker):
+    CONFIG_KWARGS = {
+        'loop': settings.SERVER_LOOP,
+        'http': settings.SERVER_HTTP,
+    }
@@ -0,0 +1,130 @@
+""" Каталог в памяти: дампы data/index_*.json вместо Elasticsearch
+
+Включается CATALOG_BACKEND=memory (db/storage.py, MemoryStorage). Дампы
+(меньше 2 МБ) читаются при старте воркера в компактные структуры:
+
+    id -> номер       - фильмы, персоны и жанры
+    posting-списки    - фильмы и роли персоны
+    документы         - _source в orjson, разбирается только при выдаче
+
+Промахи кэша по фильмам, персонам, жанрам и фильмографиям обслуживаются
+без сети. Полнотекстовый поиск остаётся за ES.
+"""
+from array import array
+from collections import defaultdict
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import orjson
+
+INDICES = {
+    'movies': 'index_movies.json',
+    'person': 'index_person.json',
+    'genres': 'index_genres.json',
+}
+# порядок ролей как в ответе api/v1/persons/{uuid}
+ROLES = ('actors', 'directors', 'writers')
+
+
+def read_index(data_dir: str, index: str) -> Iterator[Tuple[str, dict]]:
+    with open(os.path.join(data_dir, INDICES[index]), 'rb') as f:
+        for line in f:
+            if line.strip():
+                doc = orjson.loads(line)
+                yield doc['_id'], doc['_source']
+
+
+class Documents:
+    """Документы индекса: id -> номер и _source в orjson по номеру"""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.offsets: Dict[str, int] = {}
+        self.sources: List[bytes] = []
+
+    def add(self, id: str, source: dict) -> int:
+        offset = len(self.ids)
+        self.ids.append(id)
+        self.offsets[id] = offset
+        # копия: буфер orjson.dumps выделяется с запасом около 1 КБ
+        self.sources.append(bytes(memoryview(orjson.dumps(source))))
+        return offset
+
+    def get(self, id: str) -> Optional[dict]:
+        offset = self.offsets.get(id)
+        if offset is None:
+            return None
+        return orjson.loads(self.sources[offset])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class Catalog:
+    """Документы возвращаются в виде _source ES, чтобы сервисы собирали
+    модели так же, как из ответа ES.
+    """
+
+    def __init__(self, data_dir: str):
+        self.movies = Documents()
+        self.persons = Documents()
+        self.genres = Documents()
+        self.indices = {
+            'movies': self.movies,
+            'person': self.persons,
+            'genres': self.genres,
+        }
+        # персона -> номера фильмов по возрастанию id и маски ролей
+        self.person_movies: Dict[str, Tuple[array, bytes]] = {}
+        roles: Dict[str, Dict[int, int]] = defaultdict(dict)
+        for id, source in read_index(data_dir, 'movies'):
+            self._add_movie(id, source, roles)
+        for person_id, movies in roles.items():
+            offsets = sorted(movies, key=self.movies.ids.__getitem__)
+            self.person_movies[person_id] = (
+                array('I', offsets),
+                bytes(movies[offset] for offset in offsets)
+                )
+        for id, source in read_index(data_dir, 'person'):
+            self.persons.add(id, source)
+        for id, source in read_index(data_dir, 'genres'):
+            self.genres.add(id, source)
+
+    def _add_movie(
+            self,
+            id: str,
+            source: dict,
+            roles: Dict[str, Dict[int, int]]
+            ):
+        offset = self.movies.add(id, source)
+        for bit, role in enumerate(ROLES):
+            for person in source.get(role) or []:
+                movies = roles[person['id']]
+                movies[offset] = movies.get(offset, 0) | 1 << bit
+
+    # документ индекса; у person - с фильмографией,
+    # как после etl/person_movies.py
+    def get(self, index: str, id: str) -> Optional[dict]:
+        source = self.indices[index].get(id)
+        if source is not None and index == 'person':
+            source['movies'] = self._person_movies(id)
+        return source
+
+    # все документы индекса по возрастанию id
+    def scan(self, index: str) -> List[dict]:
+        documents = self.indices[index]
+        return [
+            self.get(index, id) for id in sorted(documents.offsets)
+            ]
+
+    def _person_movies(self, person_id: str) -> List[dict]:
+        offsets, masks = self.person_movies.get(person_id, ((), b''))
+        return [
+            {
+                'id': self.movies.ids[offset],
+                'roles': [
+                    role for bit, role in enumerate(ROLES) if mask >> bit & 1
+                    ],
+            }
+            for offset, mask in zip(offsets, masks)
+            ]
@@ -1,9 +1,26 @@
-from typing import Optional
-from elasticsearch import AsyncElasticsearch
+from elasticsearch import AsyncElasticsearch, AsyncTransport
 
-es: Optional[AsyncElasticsearch] = None
+from core.config import ElasticSettings
+from core.timing import ELASTIC, timed
 
 
-# Функция понадобится при внедрении зависимостей
-async def get_elastic() -> AsyncElasticsearch:
-    return es
+# каждый запрос к ES, включая повторы, учитывается в Server-Timing
+class TimedTransport(AsyncTransport):
+
+    async def perform_request(self, *args, **kwargs):
+        with timed(ELASTIC):
+            return await super().perform_request(*args, **kwargs)
+
+
+# клиент с пулом keep-alive соединений по настройкам воркера
+def create_elastic(settings: ElasticSettings) -> AsyncElasticsearch:
+    return AsyncElasticsearch(
+        hosts=[f'{settings.ELASTIC_HOST}:{settings.ELASTIC_PORT}'],
+        maxsize=settings.ELASTIC_MAX_CONNECTIONS,
+        timeout=settings.ELASTIC_TIMEOUT,
+        max_retries=settings.ELASTIC_MAX_RETRIES,
+        retry_on_timeout=settings.ELASTIC_RETRY_ON_TIMEOUT,
+        http_compress=settings.ELASTIC_HTTP_COMPRESS,
+        transport_class=TimedTransport
+        )
+
@@ -1,9 +1,20 @@
-from typing import Optional
-from redis.asyncio import Redis
+from redis.asyncio import BlockingConnectionPool, Redis
 
-redis: Optional[Redis] = None
+from core.config import RedisSettings
 
 
-# Функция понадобится при внедрении зависимостей
-async def get_redis() -> Redis:
-    return redis
+# клиент с пулом соединений по настройкам воркера
+def create_redis(settings: RedisSettings) -> Redis:
+    pool = BlockingConnectionPool(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        socket_keepalive=settings.REDIS_SOCKET_KEEPALIVE,
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+        socket_timeout=settings.REDIS_READ_TIMEOUT,
+        retry_on_timeout=settings.REDIS_RETRY_ON_TIMEOUT,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL
+        )
+    return Redis(connection_pool=pool)
+
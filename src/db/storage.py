@@ -0,0 +1,202 @@
+""" Хранилище документов сервисов: Elasticsearch или каталог в памяти
+
+Документы индексов movies, person и genres отдаются в виде _source ES:
+
+    ElasticStorage - документы и поиск в Elasticsearch
+    MemoryStorage  - документы из каталога в памяти воркера
+                     (db/catalog.py), поиск передаётся ElasticStorage
+
+Включается CATALOG_BACKEND=elastic | memory. Тела поиска строятся
+services/query_to_es и выполняются только Elasticsearch.
+"""
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from elasticsearch import AsyncElasticsearch, NotFoundError, RequestError
+from fastapi import Request
+
+from core.config import CatalogSettings, ElasticSettings
+from db import elastic
+from db.catalog import Catalog
+from services.pagination import InvalidCursor
+
+# документов за один запрос при обходе индекса
+SCAN_PAGE_SIZE = 1000
+
+# каталог, прочитанный мастером gunicorn до fork (gunicorn.conf.py):
+# воркеры делят его страницы copy-on-write
+catalog: Optional[Catalog] = None
+
+
+class Storage(ABC):
+    """Методы возвращают None / пустой результат, если индекса нет"""
+
+    # документы не меняются до перезапуска воркера
+    static = False
+    # в документах person есть фильмография (etl/person_movies.py)
+    materialized = False
+
+    @abstractmethod
+    async def get(self, index: str, id: str) -> Optional[dict]:
+        pass
+
+    # найденные документы по id
+    @abstractmethod
+    async def mget(self, index: str, ids: List[str]) -> Dict[str, dict]:
+        pass
+
+    # hits ответа ES: _id, _source, sort и inner_hits;
+    # InvalidCursor, если search_after не подходит к сортировке
+    @abstractmethod
+    async def search(self, index: str, body: dict) -> Optional[List[dict]]:
+        pass
+
+    # все документы индекса по возрастанию id; fields - нужные поля
+    # _source, хранилище может вернуть и остальные
+    @abstractmethod
+    async def scan(
+            self,
+            index: str,
+            fields: Optional[List[str]] = None
+            ) -> Optional[List[dict]]:
+        pass
+
+    @abstractmethod
+    async def ping(self) -> bool:
+        pass
+
+    @abstractmethod
+    async def close(self):
+        pass
+
+
+class ElasticStorage(Storage):
+
+    def __init__(self, elastic: AsyncElasticsearch, materialized: bool):
+        self.elastic = elastic
+        self.materialized = materialized
+
+    async def get(self, index: str, id: str) -> Optional[dict]:
+        try:
+            doc = await self.elastic.get(index, id)
+        except NotFoundError:
+            return None
+        return doc['_source']
+
+    async def mget(self, index: str, ids: List[str]) -> Dict[str, dict]:
+        try:
+            response = await self.elastic.mget(
+                body={'ids': ids},
+                index=index
+                )
+        except NotFoundError:
+            return {}
+        return {
+            doc['_id']: doc['_source']
+            for doc in response['docs'] if doc.get('found')
+            }
+
+    async def search(self, index: str, body: dict) -> Optional[List[dict]]:
+        try:
+            response = await self.elastic.search(body=body, index=index)
+        except NotFoundError:
+            return None
+        except RequestError as exc:
+            # значения курсора пришли от клиента
+            if 'search_after' in body:
+                raise InvalidCursor('cursor is not comparable') from exc
+            raise
+        return response['hits']['hits']
+
+    # страницами по id с search_after
+    async def scan(
+            self,
+            index: str,
+            fields: Optional[List[str]] = None
+            ) -> Optional[List[dict]]:
+        sources = []
+        search_after = None
+        while True:
+            body = {
+                'size': SCAN_PAGE_SIZE,
+                'sort': [{'id': {'order': 'asc'}}],
+                }
+            if fields is not None:
+                body['_source'] = fields
+            if search_after is not None:
+                body['search_after'] = search_after
+            docs = await self.search(index, body)
+            if docs is None:
+                return None
+            sources.extend(doc['_source'] for doc in docs)
+            if len(docs) < SCAN_PAGE_SIZE:
+                return sources
+            search_after = docs[-1]['sort']
+
+    async def ping(self) -> bool:
+        return await self.elastic.ping()
+
+    async def close(self):
+        await self.elastic.close()
+
+
+class MemoryStorage(Storage):
+    """Документы из каталога, полнотекстовый поиск - в search_storage"""
+
+    static = True
+    # фильмография строится каталогом при загрузке
+    materialized = True
+
+    def __init__(self, catalog: Catalog, search_storage: Storage):
+        self.catalog = catalog
+        self.search_storage = search_storage
+
+    async def get(self, index: str, id: str) -> Optional[dict]:
+        return self.catalog.get(index, id)
+
+    async def mget(self, index: str, ids: List[str]) -> Dict[str, dict]:
+        sources = {}
+        for id in ids:
+            source = self.catalog.get(index, id)
+            if source is not None:
+                sources[id] = source
+        return sources
+
+    async def search(self, index: str, body: dict) -> Optional[List[dict]]:
+        return await self.search_storage.search(index, body)
+
+    async def scan(
+            self,
+            index: str,
+            fields: Optional[List[str]] = None
+            ) -> Optional[List[dict]]:
+        return self.catalog.scan(index)
+
+    async def ping(self) -> bool:
+        return await self.search_storage.ping()
+
+    async def close(self):
+        await self.search_storage.close()
+
+
+def create_storage(settings: CatalogSettings) -> Storage:
+    elastic_settings = ElasticSettings()
+    storage = ElasticStorage(
+        elastic.create_elastic(elastic_settings),
+        elastic_settings.ELASTIC_PERSON_MOVIES == 'materialized'
+        )
+    if settings.CATALOG_BACKEND != 'memory':
+        return storage
+    return MemoryStorage(catalog or create_catalog(settings), storage)
+
+
+# None - документы берутся из ES
+def create_catalog(settings: CatalogSettings) -> Optional[Catalog]:
+    if settings.CATALOG_BACKEND != 'memory':
+        return None
+    return Catalog(settings.CATALOG_DATA_DIR)
+
+
+# хранилище своего воркера, создаётся в main.startup
+async def get_storage(request: Request) -> Storage:
+    return request.app.state.storage
@@ -0,0 +1,142 @@
+""" Хранилище кэша сервисов: redis или память воркера
+
+Cache (services/cache/cache.py) копит чтения, записи и счётчики одного
+шага event loop и отдаёт их хранилищу одним пакетом (execute):
+
+    RedisStore  - пакет уходит одним pipeline, кэш общий для воркеров
+    MemoryStore - LRU в памяти воркера, для запуска без redis
+                  (разработка, бенчмарки, один воркер)
+
+Включается CACHE_BACKEND=redis | memory.
+"""
+from abc import ABC, abstractmethod
+import math
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+from redis.asyncio import Redis
+
+from core.config import CacheSettings, RedisSettings
+from db import redis
+from services.cache.local import LocalCache
+
+# ответ на пакет: значения чтений и счётчики после увеличения
+Result = Tuple[List[Optional[bytes]], List[int]]
+
+
+class Store(ABC):
+    """Пакет команд за один поход в хранилище.
+
+    reads    - ключи для MGET
+    writes   - ключ -> (значение, TTL в секундах)
+    counters - (ключ, окно): INCR, счётчик живёт window секунд с первого
+               увеличения, 0 - без срока (версии пространств)
+    """
+
+    # между процессом и хранилищем сеть: перед ним нужны L1 и сжатие
+    remote = True
+
+    @abstractmethod
+    async def execute(
+            self,
+            reads: List[str],
+            writes: Dict[str, Tuple[bytes, int]],
+            counters: List[Tuple[str, float]]
+            ) -> Result:
+        pass
+
+    @abstractmethod
+    async def ping(self) -> bool:
+        pass
+
+    @abstractmethod
+    async def close(self):
+        pass
+
+
+class RedisStore(Store):
+
+    def __init__(self, redis: Redis):
+        self.redis = redis
+
+    async def execute(
+            self,
+            reads: List[str],
+            writes: Dict[str, Tuple[bytes, int]],
+            counters: List[Tuple[str, float]]
+            ) -> Result:
+        # номера ответов INCR в общем списке результатов pipeline
+        positions = []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            if reads:
+                pipe.mget(reads)
+            for key, (value, ttl) in writes.items():
+                pipe.set(key, value, int(ttl))
+            position = bool(reads) + len(writes)
+            for key, window in counters:
+                pipe.incr(key)
+                positions.append(position)
+                position += 1
+                if window:
+                    pipe.expire(key, int(window), nx=True)
+                    position += 1
+            results = await pipe.execute()
+        values = results[0] if reads else []
+        return values, [results[position] for position in positions]
+
+    async def ping(self) -> bool:
+        return await self.redis.ping()
+
+    async def close(self):
+        await self.redis.close(close_connection_pool=True)
+
+
+class MemoryStore(Store):
+    """Кэш только своего воркера: между воркерами он не делится,
+    сброс версий python -m services.cache.versions до него не доходит.
+    """
+
+    remote = False
+
+    def __init__(self, max_items: int, max_bytes: int):
+        self.local = LocalCache(max_items, max_bytes)
+
+    async def execute(
+            self,
+            reads: List[str],
+            writes: Dict[str, Tuple[bytes, int]],
+            counters: List[Tuple[str, float]]
+            ) -> Result:
+        values = [self.local.get(key) for key in reads]
+        for key, (value, ttl) in writes.items():
+            self.local.set(key, value, ttl)
+        return values, [
+            self._incr(key, window) for key, window in counters
+            ]
+
+    def _incr(self, key: str, window: float) -> int:
+        value = int(self.local.get(key) or 0) + 1
+        # срок счётчика не продлевается увеличением, как у EXPIRE NX
+        ttl = self.local.ttl(key) or window or math.inf
+        self.local.set(key, str(value).encode(), ttl)
+        return value
+
+    async def ping(self) -> bool:
+        return True
+
+    async def close(self):
+        self.local.clear()
+
+
+def create_store(settings: CacheSettings) -> Store:
+    if settings.CACHE_BACKEND == 'memory':
+        return MemoryStore(
+            settings.CACHE_MEMORY_MAX_ITEMS,
+            settings.CACHE_MEMORY_MAX_BYTES
+            )
+    return RedisStore(redis.create_redis(RedisSettings()))
+
+
+# хранилище своего воркера, создаётся в main.startup
+async def get_store(request: Request) -> Store:
+    return request.app.state.store
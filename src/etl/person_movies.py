@@ -0,0 +1,70 @@
+""" Фильмография персон: роли из индекса movies переносятся в документы person
+
+Запуск из src после загрузки индексов: python -m etl.person_movies
+"""
+from collections import defaultdict
+
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import bulk, scan
+
+from core.config import ElasticSettings
+from core.get_logger import get_logger
+
+# порядок ролей как в ответе api/v1/persons/{uuid}
+ROLES = ('actors', 'directors', 'writers')
+SCAN_SIZE = 1000
+logger = get_logger()
+
+
+def collect_movies(es: Elasticsearch) -> dict:
+    movie_by_person = defaultdict(lambda: defaultdict(list))
+    for movie in scan(
+            es,
+            index='movies',
+            query={'_source': ['{0}.id'.format(role) for role in ROLES]},
+            size=SCAN_SIZE
+            ):
+        for role in ROLES:
+            for person in movie['_source'].get(role) or []:
+                movie_by_person[person['id']][movie['_id']].append(role)
+    return movie_by_person
+
+
+def person_actions(es: Elasticsearch, movie_by_person: dict):
+    # фильмография пишется каждой персоне, в том числе пустая
+    for person in scan(
+            es,
+            index='person',
+            query={'_source': False},
+            size=SCAN_SIZE
+            ):
+        movies = movie_by_person.get(person['_id'], {})
+        yield {
+            '_op_type': 'update',
+            '_index': 'person',
+            '_id': person['_id'],
+            'doc': {'movies': [
+                {'id': id, 'roles': roles}
+                for id, roles in sorted(movies.items())
+                ]},
+        }
+
+
+def main():
+    settings = ElasticSettings()
+    es = Elasticsearch(
+        hosts=[f'{settings.ELASTIC_HOST}:{settings.ELASTIC_PORT}']
+        )
+    movie_by_person = collect_movies(es)
+    logger.info('Movies of %s persons collected', len(movie_by_person))
+    updated, _ = bulk(
+        es,
+        person_actions(es, movie_by_person),
+        chunk_size=SCAN_SIZE
+        )
+    es.indices.refresh(index='person')
+    logger.info('%s persons updated with movies', updated)
+
+
+if __name__ == '__main__':
+    main()
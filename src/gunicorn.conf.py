@@ -0,0 +1,41 @@
+""" Настройки gunicorn из ServerSettings (env/.env.settings)
+
+Запуск из src: gunicorn main:app -c gunicorn.conf.py
+
+До fork мастер импортирует приложение (SERVER_PRELOAD) и читает каталог
+в памяти (CATALOG_BACKEND=memory): воркеры делят эти страницы
+copy-on-write. Клиенты redis и Elasticsearch и их пулы соединений каждый
+воркер создаёт сам в main.startup, L1-кэш у каждого воркера свой.
+"""
+import gc
+import os
+import subprocess
+import sys
+
+from core.config import CacheSettings, CatalogSettings, ServerSettings
+from db import storage
+
+settings = ServerSettings()
+
+bind = settings.SERVER_BIND
+workers = settings.SERVER_WORKERS or os.cpu_count() or 1
+worker_class = 'core.worker.Worker'
+preload_app = settings.SERVER_PRELOAD
+keepalive = settings.SERVER_KEEPALIVE
+timeout = settings.SERVER_TIMEOUT
+
+
+def on_starting(server):
+    storage.catalog = storage.create_catalog(CatalogSettings())
+
+
+def when_ready(server):
+    # общий redis прогревается один раз отдельным процессом,
+    # а не каждым воркером в main.startup
+    cache = CacheSettings()
+    if cache.CACHE_WARMUP_ENABLED and cache.CACHE_BACKEND == 'redis':
+        subprocess.Popen([sys.executable, '-m', 'services.warmup'])
+        os.environ['CACHE_WARMUP_ENABLED'] = 'false'
+    # объекты мастера выводятся из-под сборщика мусора: его обходы
+    # в воркерах не копируют их страницы
+    gc.freeze()
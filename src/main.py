@@ -1,13 +1,21 @@
+import asyncio
+
 import uvicorn
-from elasticsearch import AsyncElasticsearch
 from fastapi import FastAPI
 from fastapi.responses import ORJSONResponse
-from redis.asyncio import Redis
+from redis.exceptions import RedisError
 
+from api import metrics
 from api.v1 import movies, genres, persons
-from core.config import RedisSettings, ElasticSettings, PROJECT_NAME
+from api.v1.pagination import invalid_cursor_handler
+from core.config import CacheSettings, CatalogSettings, PROJECT_NAME
 from core.get_logger import get_logger
-from db import elastic, redis
+from core.metrics import TimingMiddleware
+from db.storage import MemoryStorage, create_storage
+from db.store import create_store
+from services.pagination import InvalidCursor
+from services.sorted_index import get_sorted_indexes
+from services.warmup import warm_up
 
 
 app = FastAPI(
@@ -25,27 +33,57 @@ logger = get_logger()
 
 @app.on_event('startup')
 async def startup():
-    redis_settings = RedisSettings()
-    redis.redis = Redis(
-        host=redis_settings.REDIS_HOST,
-        port=redis_settings.REDIS_PORT
-        )
-    elastic_settings = ElasticSettings()
-    elastic.es = AsyncElasticsearch(
-        hosts=[
-            f'{elastic_settings.ELASTIC_HOST}:{elastic_settings.ELASTIC_PORT}'
-            ]
+    # клиенты и пулы соединений свои у каждого воркера: создаются
+    # после fork, а не при импорте в мастере gunicorn
+    store = app.state.store = create_store(CacheSettings())
+    storage = app.state.storage = create_storage(CatalogSettings())
+    # первое соединение открывается до запросов, недоступность только в лог
+    try:
+        await store.ping()
+    except RedisError as exc:
+        logger.error('redis ping failed: %s', exc)
+    if not await storage.ping():
+        logger.error('elasticsearch ping failed')
+    logger.info(
+        'cache in %s, documents in %s',
+        type(store).__name__,
+        type(storage).__name__
         )
-    logger.info('redis and elasticsearch startup')
+    if isinstance(storage, MemoryStorage):
+        catalog = storage.catalog
+        logger.info(
+            'in-memory catalog: %s movies, %s persons, %s genres',
+            len(catalog.movies),
+            len(catalog.persons),
+            len(catalog.genres)
+            )
+    # порядки главной из ES строятся в фоне, до готовности страницы
+    # запрашиваются у ES
+    try:
+        await get_sorted_indexes(store, storage).get()
+    except RedisError as exc:
+        logger.error('sorted index is not scheduled: %s', exc)
+    # прогрев идёт в фоне и не задерживает приём запросов
+    if CacheSettings().CACHE_WARMUP_ENABLED:
+        app.state.warmup = asyncio.ensure_future(
+            warm_up(store, storage)
+            )
 
 
 @app.on_event('shutdown')
 async def shutdown():
-    await redis.redis.close()
-    await elastic.es.close()
-    logger.info('redis and elasticsearch shutdown')
+    warmup = getattr(app.state, 'warmup', None)
+    if warmup is not None:
+        warmup.cancel()
+    await app.state.store.close()
+    await app.state.storage.close()
+    logger.info('cache and storage shutdown')
+
 
+app.add_middleware(TimingMiddleware)
+app.add_exception_handler(InvalidCursor, invalid_cursor_handler)
 
+app.include_router(metrics.router)
 app.include_router(movies.router, prefix='/api/v1/movies', tags=['Фильмы'])
 app.include_router(genres.router, prefix='/api/v1/genres', tags=['Жанры'])
 app.include_router(persons.router, prefix='/api/v1/persons', tags=['Персоны'])
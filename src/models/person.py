@@ -0,0 +1,23 @@
+""" Документ индекса elasticsearch "person" с готовой фильмографией """
+
+from typing import List, Optional
+import uuid
+
+from models._orjson import Orjson
+from models.role import Role
+
+
+class PersonMovie(Orjson):
+    id: uuid.UUID
+    # роли персоны в фильме ['actors', 'writers']
+    roles: List[str]
+
+    class Config:
+        json_encoders = {
+            uuid.UUID: lambda u: str(u)
+        }
+
+
+class PersonDoc(Role):
+    # заполняется etl/person_movies.py, None - фильмография не построена
+    movies: Optional[List[PersonMovie]] = None
@@ -0,0 +1,249 @@
+""" Кэш сервисов: L1 в памяти воркера перед хранилищем (db/store.py) """
+import asyncio
+from functools import lru_cache
+import struct
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from core.config import CacheSettings
+from core.get_logger import get_logger
+from core.timing import REDIS, timed
+from db.store import Store
+from services.cache.codec import Codec, get_codec
+from services.cache.local import LocalCache
+
+# заголовок записи stale-while-revalidate: метка и момент устаревания
+SWR_MAGIC = b'\xff'
+SWR_HEADER = struct.Struct('!cd')
+logger = get_logger()
+
+
+class Cache:
+    """Двухуровневый кэш: LocalCache (L1) и хранилище (L2), обычно redis.
+
+    ttl у чтения нужен только для L1: запись, поднятая из redis, живёт
+    в памяти воркера столько же, сколько её положили бы в redis, но не
+    дольше l1_max_ttl, чтобы L1 не переживал redis надолго.
+
+    Обращения к redis копятся в пределах одного шага event loop и уходят
+    двумя пакетами Store.execute: чтения одним MGET вместе со счётчиками
+    incr и, параллельно с ними, записи - SET с EX на каждый ключ.
+    Запись не ждёт ответа redis: она уходит с ближайшим сбросом, а её
+    ошибка только логируется и не затрагивает чтения.
+
+    codec сжимает значения только на пути в redis, L1 хранит их как есть.
+    """
+
+    def __init__(
+            self,
+            store: Store,
+            local: Optional[LocalCache] = None,
+            l1_max_ttl: float = 0,
+            codec: Optional[Codec] = None
+            ):
+        self.store = store
+        self.local = local
+        self.l1_max_ttl = l1_max_ttl
+        self.codec = codec or Codec(None, 0)
+        self._reads: Dict[str, asyncio.Future] = {}
+        self._writes: Dict[str, Tuple[bytes, int]] = {}
+        self._counters: List[Tuple[str, float, asyncio.Future]] = []
+        self._flush: Optional[asyncio.Task] = None
+        self._sending: Set[asyncio.Task] = set()
+
+    async def get(self, key: str, ttl: float) -> Optional[bytes]:
+        return (await self.mget([key], ttl))[0]
+
+    async def mget(
+            self,
+            keys: List[str],
+            ttl: float
+            ) -> List[Optional[bytes]]:
+        values: List[Optional[bytes]] = [None] * len(keys)
+        remote = []
+        # ttl <= 0 - чтение мимо L1, оно не портит его статистику
+        local = self.local if ttl > 0 else None
+        for i, key in enumerate(keys):
+            if local is not None:
+                values[i] = local.get(key)
+            if values[i] is None:
+                remote.append(i)
+        if remote:
+            found = await self._read([keys[i] for i in remote])
+            for i, value in zip(remote, found):
+                values[i] = value
+                if value is not None:
+                    self._put_local(keys[i], value, ttl)
+        return values
+
+    # запись есть в L1: чтение не пойдёт в хранилище
+    def in_local(self, key: str) -> bool:
+        return self.local is not None and self.local.ttl(key) is not None
+
+    async def set(self, key: str, value, ttl: int):
+        await self.mset({key: value}, ttl)
+
+    # несколько записей одним pipeline, у каждой свой EX
+    async def mset(self, items: Dict[str, bytes], ttl: int):
+        for key, value in items.items():
+            value = _to_bytes(value)
+            self._writes[key] = (value, ttl)
+            self._put_local(key, value, ttl)
+        if items:
+            self._schedule()
+
+    # счётчик, живущий window секунд с первого увеличения (0 - без срока);
+    # future можно не ждать, при ошибке redis он вернёт 0
+    def incr(self, key: str, window: float) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._counters.append((key, window, future))
+        self._schedule()
+        return future
+
+    async def _read(self, keys: List[str]) -> List[Optional[bytes]]:
+        loop = asyncio.get_running_loop()
+        futures = []
+        for key in keys:
+            if key in self._writes:
+                # ещё не отправленная запись видна чтению сразу
+                future = loop.create_future()
+                future.set_result(self._writes[key][0])
+            else:
+                future = self._reads.get(key)
+                if future is None:
+                    future = self._reads[key] = loop.create_future()
+            futures.append(future)
+        self._schedule()
+        # общий future не должен отменяться вместе с одним из читателей
+        with timed(REDIS):
+            return await asyncio.gather(*map(asyncio.shield, futures))
+
+    def _schedule(self):
+        if self._flush is None:
+            self._flush = asyncio.ensure_future(self._execute())
+            self._sending.add(self._flush)
+            self._flush.add_done_callback(self._sending.discard)
+
+    # дождаться отправки всех отложенных записей, например перед выходом
+    async def drain(self):
+        while self._sending:
+            await asyncio.wait(list(self._sending))
+
+    async def _execute(self):
+        self._flush = None
+        reads, self._reads = self._reads, {}
+        writes, self._writes = self._writes, {}
+        counters, self._counters = self._counters, []
+        # записи уходят отдельным пакетом параллельно с чтениями:
+        # ошибка записи не должна доставаться чтениям того же шага
+        batches = []
+        if reads or counters:
+            batches.append(self._execute_reads(reads, counters))
+        if writes:
+            batches.append(self._execute_writes(writes))
+        await asyncio.gather(*batches)
+
+    async def _execute_reads(
+            self,
+            reads: Dict[str, asyncio.Future],
+            counters: List[Tuple[str, float, asyncio.Future]]
+            ):
+        keys = list(reads)
+        try:
+            values, counts = await self.store.execute(
+                keys,
+                {},
+                [(key, window) for key, window, _ in counters]
+                )
+        except Exception as exc:
+            for future in reads.values():
+                if not future.done():
+                    future.set_exception(exc)
+            for _, _, future in counters:
+                future.set_result(0)
+            return
+        for (_, _, future), count in zip(counters, counts):
+            future.set_result(count)
+        for key, value in zip(keys, values):
+            if not reads[key].done():
+                reads[key].set_result(self._decode(key, value))
+
+    # нечитаемая запись - промах кэша только по своему ключу
+    def _decode(self, key: str, value: Optional[bytes]) -> Optional[bytes]:
+        if value is None:
+            return None
+        try:
+            return self.codec.decode(value)
+        except Exception:
+            logger.warning(
+                'cache value of %s is not decoded',
+                key,
+                exc_info=True
+                )
+            return None
+
+    async def _execute_writes(self, writes: Dict[str, Tuple[bytes, int]]):
+        try:
+            await self.store.execute(
+                [],
+                {
+                    key: (self.codec.encode(value), ttl)
+                    for key, (value, ttl) in writes.items()
+                    },
+                []
+                )
+        except Exception as exc:
+            logger.error(
+                '%s keys are not written to redis',
+                len(writes),
+                exc_info=exc
+                )
+
+    # stale-while-revalidate: запись живёт в redis hard_ttl секунд,
+    # но через soft_ttl секунд считается устаревшей
+    async def get_swr(
+            self,
+            key: str,
+            ttl: float
+            ) -> Tuple[Optional[bytes], bool]:
+        value = await self.get(key, ttl)
+        if value is None:
+            return None, False
+        if value[:1] != SWR_MAGIC:
+            # запись без заголовка (старый формат) сразу считаем устаревшей
+            return value, True
+        _, fresh_until = SWR_HEADER.unpack_from(value)
+        return value[SWR_HEADER.size:], fresh_until < time.time()
+
+    async def set_swr(
+            self,
+            key: str,
+            value,
+            soft_ttl: float,
+            hard_ttl: int
+            ):
+        header = SWR_HEADER.pack(SWR_MAGIC, time.time() + soft_ttl)
+        await self.set(key, header + _to_bytes(value), hard_ttl)
+
+    def _put_local(self, key: str, value: bytes, ttl: float):
+        if self.local is not None:
+            self.local.set(key, value, min(ttl, self.l1_max_ttl))
+
+
+def _to_bytes(value) -> bytes:
+    return value.encode() if isinstance(value, str) else value
+
+
+# L1 и сжатие нужны только перед хранилищем по сети
+@lru_cache()
+def get_cache(store: Store) -> Cache:
+    if not store.remote:
+        return Cache(store)
+    settings = CacheSettings()
+    local = None
+    if settings.CACHE_L1_ENABLED:
+        local = LocalCache(
+            settings.CACHE_L1_MAX_ITEMS,
+            settings.CACHE_L1_MAX_BYTES
+            )
+    return Cache(store, local, settings.CACHE_L1_MAX_TTL, get_codec())
@@ -0,0 +1,129 @@
+""" Формат значений кэша в redis: сжатие крупных записей
+
+Записи меньше порога хранятся как есть. Крупные хранятся со
+служебным заголовком: метка, версия формата и id алгоритма, за
+которыми идут сжатые данные. JSON, заголовок stale-while-revalidate
+и страница списков никогда не начинаются с метки, поэтому записи без
+заголовка читаются как есть.
+
+lz4 и zstd - необязательные зависимости: pip install lz4 zstandard
+"""
+from functools import lru_cache
+import struct
+from typing import Callable, Dict, NamedTuple, Optional
+import zlib
+
+from core.config import CacheSettings
+from core.get_logger import get_logger
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODEC_MAGIC = b'\xfe'
+CODEC_VERSION = 1
+CODEC_HEADER = struct.Struct('!cBB')
+logger = get_logger()
+
+
+class Algorithm(NamedTuple):
+    id: int
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+def _algorithms() -> Dict[str, Algorithm]:
+    algorithms = {
+        'zlib': Algorithm(
+            1,
+            lambda data: zlib.compress(data, 1),
+            zlib.decompress
+            ),
+    }
+    if lz4 is not None:
+        algorithms['lz4'] = Algorithm(
+            2,
+            lz4.frame.compress,
+            lz4.frame.decompress
+            )
+    if zstandard is not None:
+        compressor = zstandard.ZstdCompressor(level=3)
+        decompressor = zstandard.ZstdDecompressor()
+        algorithms['zstd'] = Algorithm(
+            3,
+            compressor.compress,
+            decompressor.decompress
+            )
+    return algorithms
+
+
+ALGORITHMS = _algorithms()
+ALGORITHMS_BY_ID = {
+    algorithm.id: algorithm for algorithm in ALGORITHMS.values()
+    }
+
+
+class Codec:
+    """Сжимает значения не меньше threshold байт выбранным алгоритмом.
+
+    Читаются записи любого установленного алгоритма, так что смена
+    CACHE_CODEC не требует сброса кэша.
+    """
+
+    def __init__(self, algorithm: Optional[str], threshold: int):
+        if algorithm == 'auto':
+            # zlib на порядок дороже lz4 по CPU, а распаковка идёт на
+            # каждом промахе L1: без lz4 значения не сжимаются
+            algorithm = 'lz4' if 'lz4' in ALGORITHMS else None
+        if algorithm in (None, 'none'):
+            self.algorithm = None
+        elif algorithm in ALGORITHMS:
+            self.algorithm = ALGORITHMS[algorithm]
+        else:
+            logger.error(
+                'cache codec %s is not available, values are stored '
+                'uncompressed',
+                algorithm
+                )
+            self.algorithm = None
+        self.threshold = threshold
+
+    def encode(self, value: bytes) -> bytes:
+        if self.algorithm is None or len(value) < self.threshold:
+            return value
+        compressed = self.algorithm.compress(value)
+        if len(compressed) + CODEC_HEADER.size >= len(value):
+            return value
+        header = CODEC_HEADER.pack(
+            CODEC_MAGIC,
+            CODEC_VERSION,
+            self.algorithm.id
+            )
+        return header + compressed
+
+    # None - запись не прочитать, для сервиса это промах кэша
+    def decode(self, value: bytes) -> Optional[bytes]:
+        if value[:1] != CODEC_MAGIC:
+            return value
+        _, version, algorithm_id = CODEC_HEADER.unpack_from(value)
+        algorithm = ALGORITHMS_BY_ID.get(algorithm_id)
+        if version != CODEC_VERSION or algorithm is None:
+            logger.warning(
+                'cache value of format %s, codec %s is skipped',
+                version,
+                algorithm_id
+                )
+            return None
+        return algorithm.decompress(value[CODEC_HEADER.size:])
+
+
+@lru_cache()
+def get_codec() -> Codec:
+    settings = CacheSettings()
+    return Codec(settings.CACHE_CODEC, settings.CACHE_CODEC_THRESHOLD)
@@ -0,0 +1,44 @@
+""" Ключи кэша: пространство сущности, эндпоинт и параметры запроса
+
+    movies:id:<uuid>             - документ
+    movies:search:<hash>         - готовый ответ списка
+
+Параметры списка нормализуются и хэшируются целиком, поэтому ключи
+разных эндпоинтов и сортировок не пересекаются, а длина ключа
+ограничена при любом запросе пользователя.
+"""
+import hashlib
+import unicodedata
+
+import orjson
+
+# id длиннее этого (не uuid) в ключ попадает хэшем
+MAX_ID_LENGTH = 64
+DIGEST_SIZE = 16
+
+
+def item_key(entity: str, id) -> str:
+    id = str(id)
+    if len(id) > MAX_ID_LENGTH:
+        id = _digest(id.encode())
+    return '{0}:id:{1}'.format(entity, id)
+
+
+def list_key(entity: str, endpoint: str, **params) -> str:
+    return '{0}:{1}:{2}'.format(
+        entity,
+        endpoint,
+        _digest(orjson.dumps(params, option=orjson.OPT_SORT_KEYS))
+        )
+
+
+# регистр, пробелы и формы записи символов (NFKC: полноширинные буквы,
+# лигатуры) плодили бы ключи одного поиска. Нормализованный запрос идёт
+# только в ключ: в ES уходит исходный, иначе не сработает точное
+# совпадение с title.raw (keyword без normalizer)
+def normalize_query(query: str) -> str:
+    return ' '.join(unicodedata.normalize('NFKC', query).casefold().split())
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).hexdigest()
@@ -0,0 +1,88 @@
+""" L1-кэш в памяти воркера: LRU с ограничением по размеру и TTL записей """
+from collections import OrderedDict
+import time
+from typing import Dict, NamedTuple, Optional
+
+
+class Entry(NamedTuple):
+    value: bytes
+    expire_at: float
+
+
+class LocalCache:
+    """LRU-кэш байтовых значений с TTL на каждую запись.
+
+    Ограничен и числом записей (max_items), и суммарным размером значений
+    (max_bytes). При переполнении сначала выбрасываются истёкшие записи,
+    затем давно не использованные.
+    """
+
+    def __init__(self, max_items: int, max_bytes: int):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._data: OrderedDict[str, Entry] = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expire_at <= time.monotonic():
+            self._pop(key)
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry.value
+
+    def set(self, key: str, value: bytes, ttl: float):
+        if ttl <= 0 or len(value) > self.max_bytes:
+            self._pop(key)
+            return
+        self._pop(key)
+        self._data[key] = Entry(value, time.monotonic() + ttl)
+        self._size += len(value)
+        if len(self._data) > self.max_items or self._size > self.max_bytes:
+            self._evict()
+
+    # сколько секунд записи осталось жить, None - записи нет
+    def ttl(self, key: str) -> Optional[float]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        remaining = entry.expire_at - time.monotonic()
+        return remaining if remaining > 0 else None
+
+    def delete(self, key: str):
+        self._pop(key)
+
+    def clear(self):
+        self._data.clear()
+        self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'items': len(self._data),
+            'bytes': self._size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def _pop(self, key: str):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry.value)
+
+    def _evict(self):
+        now = time.monotonic()
+        for key in [k for k, e in self._data.items() if e.expire_at <= now]:
+            self._pop(key)
+        while len(self._data) > self.max_items or self._size > self.max_bytes:
+            _, entry = self._data.popitem(last=False)
+            self._size -= len(entry.value)
+            self.evictions += 1
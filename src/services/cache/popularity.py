@@ -0,0 +1,69 @@
+""" Популярность запросов: TTL ответа растёт с числом запросов
+
+Поиск, который не нашёл ответ в L1, увеличивает счётчик своего
+нормализованного запроса в redis (INCR уходит общим pipeline с чтением
+кэша); попадание в L1 в redis не ходит и не считается. Счётчик живёт
+window секунд, но не меньше max_ttl: иначе он истекал бы вместе с
+ответом и TTL не рос бы. Каждые step запросов за окно удваивают TTL
+ответа, но не выше max_ttl: частые запросы дольше остаются в кэше и
+реже доходят до ES.
+"""
+import asyncio
+from functools import lru_cache
+from typing import Optional
+
+from core.config import CacheSettings
+from db.store import Store
+from services.cache.cache import Cache, get_cache
+from services.cache.keys import list_key
+
+# дальше удваивать незачем: TTL всё равно упирается в max_ttl
+MAX_DOUBLINGS = 16
+
+
+class Popularity:
+
+    def __init__(
+            self,
+            cache: Cache,
+            window: float,
+            step: int,
+            max_ttl: int
+            ):
+        self.cache = cache
+        self.window = max(window, max_ttl)
+        self.step = step
+        self.max_ttl = max_ttl
+
+    # учесть запрос; счётчик нужен только при промахе кэша
+    def touch(self, entity: str, query: str) -> Optional[asyncio.Future]:
+        if self.step <= 0:
+            return None
+        return self.cache.incr(
+            list_key(entity, 'popularity', query=query),
+            self.window
+            )
+
+    async def ttl(
+            self,
+            counter: Optional[asyncio.Future],
+            base_ttl: int
+            ) -> int:
+        if counter is None:
+            return base_ttl
+        doublings = min(await counter // self.step, MAX_DOUBLINGS)
+        # SET EX в redis-py принимает только int
+        return int(
+            max(base_ttl, min(base_ttl * 2 ** doublings, self.max_ttl))
+            )
+
+
+@lru_cache()
+def get_popularity(store: Store) -> Popularity:
+    settings = CacheSettings()
+    return Popularity(
+        get_cache(store),
+        settings.CACHE_POPULARITY_WINDOW,
+        settings.CACHE_POPULARITY_STEP,
+        settings.CACHE_POPULARITY_MAX_TTL
+        )
@@ -0,0 +1,134 @@
+""" Склейка одновременных промахов кэша по одному ключу (single-flight) """
+import asyncio
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from redis.asyncio import Redis
+from redis.exceptions import LockError, RedisError
+
+from core.config import CacheSettings
+from core.get_logger import get_logger
+from core.metrics import uncounted
+from db.store import RedisStore, Store
+
+Loader = Callable[[], Awaitable[Any]]
+logger = get_logger()
+
+
+class SingleFlight:
+    """Внутри воркера ключ пересобирает только одна корутина.
+
+    Остальные корутины с тем же ключом ждут её результат (или исключение).
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    async def do(
+            self,
+            key: str,
+            build: Loader,
+            recheck: Optional[Loader] = None
+            ) -> Any:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._run(key, build, recheck))
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+        # отмена одного ожидающего не должна отменять общую пересборку
+        return await asyncio.shield(future)
+
+    # пересборка в фоне, если ключ ещё никто не пересобирает
+    def spawn(
+            self,
+            key: str,
+            build: Loader,
+            recheck: Optional[Loader] = None
+            ):
+        if key in self._calls:
+            return
+        future = asyncio.ensure_future(self._run(key, build, recheck))
+        self._calls[key] = future
+        future.add_done_callback(lambda done: self._spawned(key, done))
+
+    def _spawned(self, key: str, future: asyncio.Future):
+        self._forget(key, future)
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(
+                'Background rebuild of %s failed',
+                key,
+                exc_info=future.exception()
+                )
+
+    def _forget(self, key: str, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+
+    async def _run(
+            self,
+            key: str,
+            build: Loader,
+            recheck: Optional[Loader]
+            ) -> Any:
+        return await build()
+
+
+class RedisSingleFlight(SingleFlight):
+    """Single-flight между воркерами gunicorn на блокировке в redis.
+
+    Внутри воркера промахи склеиваются как в SingleFlight, а между
+    воркерами ключ строит владелец блокировки lock:<key>. Остальные ждут
+    блокировку не дольше wait секунд и перечитывают кэш через recheck.
+    """
+
+    def __init__(self, redis: Redis, timeout: float, wait: float):
+        super().__init__()
+        self.redis = redis
+        self.timeout = timeout
+        self.wait = wait
+
+    async def _run(
+            self,
+            key: str,
+            build: Loader,
+            recheck: Optional[Loader]
+            ) -> Any:
+        lock = self.redis.lock(
+            f'lock:{key}',
+            timeout=self.timeout,
+            blocking_timeout=self.wait
+            )
+        try:
+            acquired = await lock.acquire()
+        except RedisError:
+            logger.warning('Lock for %s is unavailable', key)
+            return await build()
+        try:
+            # пока ждали блокировку, ключ мог собрать другой воркер
+            if recheck is not None:
+                with uncounted():
+                    value = await recheck()
+                if value:
+                    return value
+            return await build()
+        finally:
+            if acquired:
+                try:
+                    await lock.release()
+                except (LockError, RedisError):
+                    # блокировка истекла по timeout, ключ уже чужой
+                    pass
+
+
+# блокировка между воркерами возможна только в redis
+@lru_cache()
+def get_single_flight(store: Store) -> SingleFlight:
+    settings = CacheSettings()
+    if settings.CACHE_SINGLE_FLIGHT == 'redis' and \
+            isinstance(store, RedisStore):
+        return RedisSingleFlight(
+            store.redis,
+            settings.CACHE_LOCK_TIMEOUT,
+            settings.CACHE_LOCK_WAIT
+            )
+    return SingleFlight()
@@ -0,0 +1,184 @@
+""" Версии пространств ключей кэша: сброс кэша без удаления ключей
+
+Версия пространства (movies, persons, genres) хранится в redis и входит
+в каждый ключ. Увеличение версии после перезаливки индексов делает все
+старые ключи недостижимыми, они доживают свой TTL и вытесняются.
+
+Сброс из src: python -m services.cache.versions [movies persons genres]
+"""
+import asyncio
+from functools import lru_cache
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from core.config import CacheSettings
+from core.metrics import count_cache
+from core.get_logger import get_logger
+from db.store import Store, create_store
+from services.cache.cache import Cache, get_cache
+
+NAMESPACES = ('movies', 'persons', 'genres')
+logger = get_logger()
+
+
+class Versions:
+    """Текущие версии пространств.
+
+    Версии держатся в памяти воркера ttl секунд, поэтому сброс доходит
+    до остальных воркеров с задержкой не больше ttl.
+    """
+
+    def __init__(self, cache: Cache, ttl: float):
+        self.cache = cache
+        self.ttl = ttl
+        self._local: Dict[str, Tuple[int, float]] = {}
+
+    async def get(self, namespaces: Iterable[str]) -> Dict[str, int]:
+        now = time.monotonic()
+        versions = {}
+        expired = []
+        for namespace in namespaces:
+            version, expire_at = self._local.get(namespace, (0, 0))
+            if expire_at > now:
+                versions[namespace] = version
+            else:
+                expired.append(namespace)
+        if expired:
+            # ttl=0: мимо L1, но в общем pipeline с остальными чтениями
+            values = await self.cache.mget(
+                [_version_key(namespace) for namespace in expired],
+                0
+                )
+            for namespace, value in zip(expired, values):
+                versions[namespace] = int(value or 0)
+                self._local[namespace] = (
+                    versions[namespace],
+                    now + self.ttl
+                    )
+        return versions
+
+    async def prefix(self, namespaces: Iterable[str]) -> str:
+        versions = await self.get(namespaces)
+        return ''.join(
+            '{0}.{1}:'.format(namespace, version)
+            for namespace, version in versions.items()
+            )
+
+    async def bump(self, namespaces: Iterable[str]):
+        namespaces = list(namespaces)
+        # мимо Cache.incr: ошибка хранилища должна дойти до вызывающего
+        await self.cache.store.execute(
+            [],
+            {},
+            [(_version_key(namespace), 0) for namespace in namespaces]
+            )
+        for namespace in namespaces:
+            self._local.pop(namespace, None)
+
+
+class VersionedCache:
+    """Cache, ключи которого начинаются с версий своих пространств"""
+
+    def __init__(
+            self,
+            cache: Cache,
+            versions: Versions,
+            namespaces: Tuple[str, ...]
+            ):
+        self.cache = cache
+        self.versions = versions
+        self.namespaces = namespaces
+
+    async def get(self, key: str, ttl: float) -> Optional[bytes]:
+        value = await self.cache.get(await self._key(key), ttl)
+        self._count([value])
+        return value
+
+    async def mget(
+            self,
+            keys: List[str],
+            ttl: float
+            ) -> List[Optional[bytes]]:
+        prefix = await self.versions.prefix(self.namespaces)
+        values = await self.cache.mget([prefix + key for key in keys], ttl)
+        self._count(values)
+        return values
+
+    async def in_local(self, key: str) -> bool:
+        return self.cache.in_local(await self._key(key))
+
+    async def set(self, key: str, value, ttl: int):
+        await self.cache.set(await self._key(key), value, ttl)
+
+    async def mset(self, items: Dict[str, bytes], ttl: int):
+        prefix = await self.versions.prefix(self.namespaces)
+        await self.cache.mset(
+            {prefix + key: value for key, value in items.items()},
+            ttl
+            )
+
+    async def get_swr(
+            self,
+            key: str,
+            ttl: float
+            ) -> Tuple[Optional[bytes], bool]:
+        value, stale = await self.cache.get_swr(await self._key(key), ttl)
+        self._count([value])
+        return value, stale
+
+    async def set_swr(
+            self,
+            key: str,
+            value,
+            soft_ttl: float,
+            hard_ttl: int
+            ):
+        await self.cache.set_swr(
+            await self._key(key),
+            value,
+            soft_ttl,
+            hard_ttl
+            )
+
+    async def _key(self, key: str) -> str:
+        return await self.versions.prefix(self.namespaces) + key
+
+    # промахи и попадания - по первому, основному пространству
+    def _count(self, values: List[Optional[bytes]]):
+        hits = sum(value is not None for value in values)
+        count_cache(self.namespaces[0], hits, len(values) - hits)
+
+
+def _version_key(namespace: str) -> str:
+    return 'version:{0}'.format(namespace)
+
+
+@lru_cache()
+def get_versions(store: Store) -> Versions:
+    return Versions(get_cache(store), CacheSettings().CACHE_VERSION_TTL)
+
+
+def get_versioned_cache(store: Store, *namespaces: str) -> VersionedCache:
+    return VersionedCache(get_cache(store), get_versions(store), namespaces)
+
+
+async def main(namespaces: List[str]):
+    unknown = set(namespaces) - set(NAMESPACES)
+    if unknown:
+        raise SystemExit('unknown namespaces: {0}'.format(
+            ', '.join(sorted(unknown))
+            ))
+    settings = CacheSettings()
+    if settings.CACHE_BACKEND == 'memory':
+        raise SystemExit('CACHE_BACKEND=memory: cache lives in workers')
+    store = create_store(settings)
+    try:
+        await get_versions(store).bump(namespaces)
+    finally:
+        await store.close()
+    logger.info('cache versions bumped: %s', ', '.join(namespaces))
+
+
+if __name__ == '__main__':
+    asyncio.run(main(sys.argv[1:] or list(NAMESPACES)))
@@ -1,121 +1,146 @@
-from functools import lru_cache
+from functools import lru_cache, partial
 from typing import List, Optional
 
-from elasticsearch import AsyncElasticsearch, NotFoundError
 from fastapi import Depends
 import orjson
-from redis.asyncio import Redis
 
-from db.elastic import get_elastic
-from db.redis import get_redis
+from db.storage import Storage, get_storage
+from db.store import Store, get_store
 from models.genre import Genre
-from models._orjson import orjson_dumps
-from core.get_logger import get_logger
-
-GENRE_CACHE_EXPIRE_IN_SECONDS = 5 * 60  # 5 минут
+from schemas.genre import Genre as GenreResponse
+from services.cache.versions import get_versioned_cache
+from services.cache.keys import item_key, list_key
+from services.cache.single_flight import get_single_flight
+from core.get_logger import get_cache_logger, get_logger
+from core.timing import SERIALIZATION, VALIDATION, timed
+
+GENRE_CACHE_EXPIRE_IN_SECONDS = 24 * 60 * 60  # 1 сутки
+GENRES_KEY = list_key('genres', 'all')
 logger = get_logger()
+# чтение и запись redis на каждый запрос - выборочно
+cache_logger = get_cache_logger()
 
 
 class GenreService:
-    def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
-        self.redis = redis
-        self.elastic = elastic
+    def __init__(self, store: Store, storage: Storage):
+        self.storage = storage
+        self.cache = get_versioned_cache(store, 'genres')
+        self.single_flight = get_single_flight(store)
 
     # один жанр
     async def get_by_id(self, genre_id: str) -> Optional[Genre]:
         genre = await self._genre_from_cache(genre_id)
         if not genre:
-            genre = await self._get_genre_from_elastic(genre_id)
-            if not genre:
-                return None
-            await self._put_genre_to_cache(genre)
+            genre = await self.single_flight.do(
+                item_key('genres', genre_id),
+                partial(self._load_genre, genre_id),
+                partial(self._genre_from_cache, genre_id)
+                )
+        return genre
+
+    async def _load_genre(self, genre_id: str) -> Optional[Genre]:
+        genre = await self._get_genre_from_storage(genre_id)
+        if not genre:
+            return None
+        await self._put_genre_to_cache(genre)
         return genre
 
-    async def _get_genre_from_elastic(self, genre_id: str) -> Optional[Genre]:
-        try:
-            doc = await self.elastic.get('genres', genre_id)
-            logger.info('Genre {0} request from ES'.format(genre_id))
-        except NotFoundError:
+    async def _get_genre_from_storage(self, genre_id: str) -> Optional[Genre]:
+        source = await self.storage.get('genres', genre_id)
+        if not source:
             return None
-        return Genre(**doc['_source'])
+        logger.info('Genre %s request from storage', genre_id)
+        with timed(VALIDATION):
+            return Genre(**source)
 
     async def _genre_from_cache(self, genre_id: str) -> Optional[Genre]:
-        data = await self.redis.get(genre_id)
+        data = await self.cache.get(
+            item_key('genres', genre_id),
+            GENRE_CACHE_EXPIRE_IN_SECONDS
+            )
         if not data:
             return None
-        genre = Genre.parse_raw(data)
-        logger.info('Genre {0} get from redis'.format(genre_id))
+        with timed(VALIDATION):
+            genre = Genre.parse_raw(data)
+        cache_logger.info('Genre %s get from redis', genre_id)
         return genre
 
     async def _put_genre_to_cache(self, genre: Genre):
-        await self.redis.set(
-            str(genre.id),
-            genre.json(),
+        with timed(SERIALIZATION):
+            data = genre.json()
+        await self.cache.set(
+            item_key('genres', genre.id),
+            data,
             GENRE_CACHE_EXPIRE_IN_SECONDS
             )
-        logger.info(
-            'Genre {0} put into redis for {1} seconds'.format(
-                str(genre.id),
-                GENRE_CACHE_EXPIRE_IN_SECONDS
-                )
+        cache_logger.info(
+            'Genre %s put into redis for %s seconds',
+            genre.id,
+            GENRE_CACHE_EXPIRE_IN_SECONDS
             )
 
-    # все жанры
-    async def get_all_genres(self) -> Optional[List[Genre]]:
+    # все жанры: готовое тело ответа List[schemas.genre.Genre]
+    async def get_all_genres(self) -> Optional[bytes]:
         genres = await self._genres_from_cache()
         if not genres:
-            genres = await self._get_all_genres_from_elastic()
-            if not genres:
-                return None
-            await self._put_genres_to_cache(genres)
+            genres = await self.single_flight.do(
+                GENRES_KEY,
+                self._load_all_genres,
+                self._genres_from_cache
+                )
         return genres
 
-    async def _get_all_genres_from_elastic(self) -> List[Genre]:
-        try:
-            genres = []
-            genres_es = (await self.elastic.search(
-                index='genres'
-                ))['hits']['hits']
-            logger.info('all genres request from ES')
-            for genre in genres_es:
-                genres.append(Genre(**genre['_source']))
-        except NotFoundError:
+    async def _load_all_genres(self) -> Optional[bytes]:
+        genres = await self._get_all_genres_from_storage()
+        if not genres:
             return None
-        return genres
+        return await self._put_genres_to_cache(genres)
 
-    async def _genres_from_cache(self) -> Optional[List[Genre]]:
-        data = await self.redis.get('genres')
-        if not data:
+    # весь индекс по возрастанию id: порядок один во всех хранилищах
+    async def _get_all_genres_from_storage(self) -> Optional[List[Genre]]:
+        sources = await self.storage.scan('genres')
+        if sources is None:
             return None
-        data = orjson.loads(data)
-        genres = []
-        for genre in data:
-            genres.append(Genre.parse_raw(genre))
-        logger.info('all genres get from redis')
-        return genres
-
-    async def _put_genres_to_cache(self, genres: List[Genre]):
-        genres_dump = []
-        for genre in genres:
-            genres_dump.append(genre.json())
-
-        data = orjson_dumps(genres_dump, default='default')
+        logger.info('all genres request from storage')
+        with timed(VALIDATION):
+            return [Genre(**source) for source in sources]
 
-        await self.redis.set(
-            'genres',
+    async def _genres_from_cache(self) -> Optional[bytes]:
+        data = await self.cache.get(
+            GENRES_KEY,
+            GENRE_CACHE_EXPIRE_IN_SECONDS
+            )
+        if not data:
+            return None
+        cache_logger.info('all genres get from redis')
+        return data
+
+    async def _put_genres_to_cache(self, genres: List[Genre]) -> bytes:
+        with timed(SERIALIZATION):
+            data = orjson.dumps([
+                GenreResponse(
+                    uuid=genre.id,
+                    name=genre.name,
+                    description=genre.description
+                    ).dict()
+                for genre in genres
+                ])
+
+        await self.cache.set(
+            GENRES_KEY,
             data,
             GENRE_CACHE_EXPIRE_IN_SECONDS
             )
-        logger.info(
-            'list of all genres put into redis for {0} seconds'.format(
-                GENRE_CACHE_EXPIRE_IN_SECONDS
-                )
+        cache_logger.info(
+            'list of all genres put into redis for %s seconds',
+            GENRE_CACHE_EXPIRE_IN_SECONDS
             )
+        return data
 
 
 @lru_cache()
 def get_genre_service(
-        redis: Redis = Depends(get_redis),
-        elastic: AsyncElasticsearch = Depends(get_elastic),
+        store: Store = Depends(get_store),
+        storage: Storage = Depends(get_storage),
 ) -> GenreService:
-    return GenreService(redis, elastic)
+    return GenreService(store, storage)
@@ -1,74 +1,163 @@
-from functools import lru_cache
-from typing import Optional, List
+from functools import lru_cache, partial
+from typing import Optional, List, Tuple
 import uuid
 
-from elasticsearch import AsyncElasticsearch, NotFoundError
 from fastapi import Depends
-from redis.asyncio import Redis
 import orjson
 
-from db.elastic import get_elastic
-from db.redis import get_redis
+from core.config import CacheSettings
+from db.storage import Storage, get_storage
+from db.store import Store, get_store
 from models.movie import Movie
-from models._orjson import orjson_dumps
 from services.query_to_es.search_movie import search_movie_query
 from services.query_to_es.sorted_movie import sorted_movie_query
 from services.query_to_es.genre_sorted_movie import genre_sorted_movie_query
-from core.get_logger import get_logger
+from services.cache.versions import get_versioned_cache
+from services.cache.keys import item_key, list_key, normalize_query
+from services.cache.popularity import get_popularity
+from services.cache.single_flight import get_single_flight
+from services.sorted_index import get_sorted_indexes
+from services.pagination import Page, MOVIES_SCORE_SORT, cursor_sort, \
+    encode_cursor, next_cursor, page_key, pack_page, unpack_page
+from core.get_logger import get_cache_logger, get_logger
+from core.timing import SERIALIZATION, VALIDATION, timed
 from schemas.movie_short import MovieShort
 
 
-MOVIE_CACHE_EXPIRE_IN_SECONDS = 5 * 60  # 5 минут
-FIND_MOVIES_CACHE_EXPIRE_IN_SECONDS = 20  # 20 секунд
-SORTED_MOVIES_CACHE_EXPIRE_IN_SECONDS = 60 * 60  # 1 час
+# ключи версионируются (services/cache/versions.py), после перезаливки
+# индексов кэш сбрасывается сменой версии, а не истечением TTL
+MOVIE_CACHE_EXPIRE_IN_SECONDS = 24 * 60 * 60  # 1 сутки
+# популярные запросы живут дольше (services/cache/popularity.py)
+FIND_MOVIES_CACHE_EXPIRE_IN_SECONDS = 60 * 60  # 1 час
+SORTED_MOVIES_CACHE_EXPIRE_IN_SECONDS = 6 * 60 * 60  # 6 часов
+# сколько устаревшая страница главной ещё может отдаваться из кэша
+SORTED_MOVIES_STALE_EXPIRE_IN_SECONDS = 7 * 24 * 60 * 60  # 1 неделя
 logger = get_logger()
+# чтение и запись redis на каждый запрос - выборочно
+cache_logger = get_cache_logger()
 
 
 class MovieService:
-    def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
-        self.redis = redis
-        self.elastic = elastic
+    def __init__(self, store: Store, storage: Storage):
+        self.storage = storage
+        self.cache = get_versioned_cache(store, 'movies')
+        self.single_flight = get_single_flight(store)
+        self.popularity = get_popularity(store)
+        self.sorted_indexes = get_sorted_indexes(store, storage)
+        self.swr = CacheSettings().CACHE_SWR_ENABLED
 
     # один фильм целиком
     async def get_by_id(self, movie_id: str) -> Optional[Movie]:
-        movie = await self._movie_from_cache(movie_id)
+        data = await self.get_raw_by_id(movie_id)
+        if not data:
+            return None
+        with timed(VALIDATION):
+            return Movie.parse_raw(data)
+
+    # JSON фильма из кэша: по нему ручка считает ETag до разбора модели
+    async def get_raw_by_id(self, movie_id: str) -> Optional[bytes]:
+        data = await self._movie_from_cache(movie_id)
+        if not data:
+            data = await self.single_flight.do(
+                item_key('movies', movie_id),
+                partial(self._load_movie, movie_id),
+                partial(self._movie_from_cache, movie_id)
+                )
+        return data
+
+    async def _load_movie(self, movie_id: str) -> Optional[bytes]:
+        movie = await self._get_movie_from_storage(movie_id)
         if not movie:
-            movie = await self._get_movie_from_elastic(movie_id)
-            if not movie:
-                return None
-            await self._put_movie_to_cache(movie)
-        return movie
+            return None
+        return await self._put_movie_to_cache(movie)
 
-    async def _get_movie_from_elastic(
+    async def _get_movie_from_storage(
             self,
             movie_id: str
             ) -> Optional[Movie]:
-        try:
-            doc = await self.elastic.get('movies', movie_id)
-        except NotFoundError:
+        source = await self.storage.get('movies', movie_id)
+        if not source:
             return None
-        logger.info('Movie {0} request from ES'.format(movie_id))
-        return Movie(**doc['_source'])
+        logger.info('Movie %s request from storage', movie_id)
+        with timed(VALIDATION):
+            return Movie(**source)
 
-    async def _movie_from_cache(self, movie_id: str) -> Optional[Movie]:
-        data = await self.redis.get(movie_id)
+    async def _movie_from_cache(self, movie_id: str) -> Optional[bytes]:
+        data = await self.cache.get(
+            item_key('movies', movie_id),
+            MOVIE_CACHE_EXPIRE_IN_SECONDS
+            )
         if not data:
             return None
-        movie = Movie.parse_raw(data)
-        logger.info('Movie {0} get from redis'.format(movie_id))
-        return movie
-
-    async def _put_movie_to_cache(self, movie: Movie):
-        await self.redis.set(
-            str(movie.id),
-            movie.json(),
+        cache_logger.info('Movie %s get from redis', movie_id)
+        return data
+
+    async def _put_movie_to_cache(self, movie: Movie) -> bytes:
+        with timed(SERIALIZATION):
+            data = movie.json().encode()
+        await self.cache.set(
+            item_key('movies', movie.id),
+            data,
             MOVIE_CACHE_EXPIRE_IN_SECONDS
             )
-        logger.info(
-            'Movie {0} put into redis for {1} seconds'.format(
-                str(movie.id),
-                MOVIE_CACHE_EXPIRE_IN_SECONDS
-                )
+        cache_logger.info(
+            'Movie %s put into redis for %s seconds',
+            movie.id,
+            MOVIE_CACHE_EXPIRE_IN_SECONDS
+            )
+        return data
+
+    # несколько фильмов целиком: не больше двух походов в redis и хранилище
+    async def get_by_ids(self, movie_ids: List[str]) -> List[Movie]:
+        if not movie_ids:
+            return []
+        movies = await self._movies_from_cache(movie_ids)
+        missing = [id for id in movie_ids if id not in movies]
+        if missing:
+            found = await self._get_movies_from_storage(missing)
+            if found:
+                await self._put_movies_to_cache(found)
+                for movie in found:
+                    movies[str(movie.id)] = movie
+        # порядок как в запросе, ненайденные фильмы пропускаем
+        return [movies[id] for id in movie_ids if id in movies]
+
+    async def _get_movies_from_storage(
+            self,
+            movie_ids: List[str]
+            ) -> List[Movie]:
+        sources = await self.storage.mget('movies', movie_ids)
+        logger.info('%s movies request from storage', len(movie_ids))
+        with timed(VALIDATION):
+            return [Movie(**source) for source in sources.values()]
+
+    async def _movies_from_cache(self, movie_ids: List[str]) -> dict:
+        values = await self.cache.mget(
+            [item_key('movies', movie_id) for movie_id in movie_ids],
+            MOVIE_CACHE_EXPIRE_IN_SECONDS
+            )
+        with timed(VALIDATION):
+            movies = {
+                movie_id: Movie.parse_raw(data)
+                for movie_id, data in zip(movie_ids, values) if data
+                }
+        cache_logger.info(
+            '%s of %s movies get from redis',
+            len(movies),
+            len(movie_ids)
+            )
+        return movies
+
+    async def _put_movies_to_cache(self, movies: List[Movie]):
+        with timed(SERIALIZATION):
+            items = {
+                item_key('movies', movie.id): movie.json() for movie in movies
+                }
+        await self.cache.mset(items, MOVIE_CACHE_EXPIRE_IN_SECONDS)
+        cache_logger.info(
+            '%s movies put into redis for %s seconds',
+            len(movies),
+            MOVIE_CACHE_EXPIRE_IN_SECONDS
             )
 
     # /movie/search
@@ -76,56 +165,82 @@ class MovieService:
             self,
             query: str,
             page_number,
-            page_size
-            ) -> Optional[List[MovieShort]]:
-        find_movies = await self._find_movies_from_cache(
-            key=f'{query}_{page_number}_{page_size}'
+            page_size,
+            search_after: Optional[list] = None
+            ) -> Optional[Page]:
+        # ключ кэша и счётчик - по нормализованному запросу, а в ES
+        # запрос уходит как есть: title.raw различает регистр
+        normalized = normalize_query(query)
+        query = query.strip()
+        key = list_key(
+            'movies',
+            'search',
+            query=normalized,
+            page=page_key(page_number, search_after),
+            size=page_size
             )
+        # попадание в L1 не ходит в redis и популярность не считает
+        counter = None
+        if not await self.cache.in_local(key):
+            counter = self.popularity.touch('movies', normalized)
+        find_movies = await self._find_movies_from_cache(key)
         if not find_movies:
-            find_movies = await self._get_find_movies_from_elastic(
-                query,
-                page_number,
-                page_size
+            ttl = await self.popularity.ttl(
+                counter,
+                FIND_MOVIES_CACHE_EXPIRE_IN_SECONDS
                 )
-            if not find_movies:
-                return None
-            await self._put_find_movies_to_cache(
-                key=f'{query}_{page_number}_{page_size}',
-                find_movies=find_movies
+            find_movies = await self.single_flight.do(
+                key,
+                partial(
+                    self._load_movies,
+                    key,
+                    ttl,
+                    self._get_find_movies_from_storage,
+                    query,
+                    page_number,
+                    page_size,
+                    search_after
+                    ),
+                partial(self._find_movies_from_cache, key)
                 )
         return find_movies
 
-    async def _get_find_movies_from_elastic(
+    # промах кэша списка: запрос в хранилище и запись в redis готового ответа
+    async def _load_movies(
+            self,
+            key: str,
+            ttl: int,
+            from_storage,
+            *args
+            ) -> Optional[Page]:
+        movies, cursor = await from_storage(*args) or ([], None)
+        if not movies:
+            return None
+        return await self._put_find_movies_to_cache(
+            key=key,
+            find_movies=movies,
+            cursor=cursor,
+            ttl=ttl
+            )
+
+    async def _get_find_movies_from_storage(
             self,
             query: str,
             page_number: int,
-            page_size: int
-            ) -> Optional[List[str]]:
-        try:
-            find_movies = []
-
-            body = search_movie_query(query, page_number, page_size)
-            response = await self.elastic.search(
-                body=body,
-                index='movies',
-                size=page_size
-                )
-            logger.info(
-                'Movies list on demand {0} request from ES'.format(query)
+            page_size: int,
+            search_after: Optional[list] = None
+            ) -> Optional[Tuple[List[MovieShort], Optional[str]]]:
+        body = search_movie_query(
+            query,
+            page_number,
+            page_size,
+            search_after
             )
-            docs = response['hits']['hits']
-            find_movies = []
-            for doc in docs:
-                find_movies.append(MovieShort(
-                    uuid=doc['_source']['id'],
-                    imdb_rating=doc['_source']['imdb_rating'],
-                    title=doc['_source']['title']
-                    )
-                )
-
-        except NotFoundError:
+        docs = await self.storage.search('movies', body)
+        if docs is None:
             return None
-        return find_movies
+        logger.info('Movies list on demand %s request from ES', query)
+        return self._movies_from_docs(docs, page_size, MOVIES_SCORE_SORT)
 
     # главная
     async def get_sorted_movies(
@@ -134,64 +249,65 @@ class MovieService:
             sorted_field: str,
             page_number: int,
             page_size: int,
-            ) -> Optional[List[MovieShort]]:
-        sorted_movies = await self._find_movies_from_cache(
-            key=f'index_page_{page_number}_{page_size}'
+            search_after: Optional[list] = None,
+            fresh: bool = False
+            ) -> Optional[Page]:
+        key = list_key(
+            'movies',
+            'index',
+            sort=[order, sorted_field],
+            page=page_key(page_number, search_after),
+            size=page_size
+            )
+        return await self._get_index_page(
+            key,
+            self._get_sorted_movies_from_storage,
+            order,
+            sorted_field,
+            page_number,
+            page_size,
+            search_after,
+            fresh=fresh
             )
-        if not sorted_movies:
-            sorted_movies = await self._get_sorted_movies_from_elastic(
-                order,
-                sorted_field,
-                page_number,
-                page_size
-                )
-            if not sorted_movies:
-                return None
-            await self._put_find_movies_to_cache(
-                key=f'index_page_{page_number}_{page_size}',
-                find_movies=sorted_movies
-                )
-        return sorted_movies
 
-    async def _get_sorted_movies_from_elastic(
+    async def _get_sorted_movies_from_storage(
             self,
             order: str,
             sorted_field: str,
             page_number: int,
-            page_size: int
-            ) -> Optional[List[MovieShort]]:
-        try:
-            sorted_movies = []
-            body = sorted_movie_query(
-                order,
-                sorted_field,
-                page_number,
-                page_size
-                )
-            response = await self.elastic.search(
-                body=body,
-                index='movies',
-                size=page_size
-                )
-            logger.info(
-                'Movies list with order {0} and sorted on {1} \
-                 request from ES'.format(
-                    order,
-                    sorted_field)
+            page_size: int,
+            search_after: Optional[list] = None
+            ) -> Optional[Tuple[List[MovieShort], Optional[str]]]:
+        movies = await self._sorted_movies_from_index(
+            order,
+            sorted_field,
+            page_number,
+            page_size,
+            None,
+            search_after
             )
-            docs = response['hits']['hits']
-            sorted_movies = []
-            for doc in docs:
-                sorted_movies.append(MovieShort(
-                    uuid=doc['_source']['id'],
-                    imdb_rating=doc['_source']['imdb_rating'],
-                    title=doc['_source']['title']
-                    )
-                )
-
-        except NotFoundError:
+        if movies is not None:
+            return movies
+        body = sorted_movie_query(
+            order,
+            sorted_field,
+            page_number,
+            page_size,
+            search_after
+            )
+        docs = await self.storage.search('movies', body)
+        if docs is None:
             return None
-        return sorted_movies
+        logger.info(
+            'Movies list with order %s and sorted on %s request from ES',
+            order,
+            sorted_field
+            )
+        return self._movies_from_docs(
+            docs,
+            page_size,
+            cursor_sort(order, sorted_field)
+            )
 
     async def get_genres_sorted_movies(
             self,
@@ -199,109 +315,273 @@ class MovieService:
             sorted_field: str,
             page_number,
             page_size,
-            genre: uuid.UUID
-            ) -> Optional[List[MovieShort]]:
-        genres_sorted_movies = await self._find_movies_from_cache(
-            key=f'{genre}_{page_number}_{page_size}'
+            genre: uuid.UUID,
+            search_after: Optional[list] = None,
+            fresh: bool = False
+            ) -> Optional[Page]:
+        key = list_key(
+            'movies',
+            'genre',
+            genre=str(genre),
+            sort=[order, sorted_field],
+            page=page_key(page_number, search_after),
+            size=page_size
             )
-        if not genres_sorted_movies:
-            genres_sorted_movies = \
-                await self._get_genres_sorted_movies_from_elastic(
-                    order,
-                    sorted_field,
-                    page_number,
-                    page_size,
-                    genre
+        return await self._get_index_page(
+            key,
+            self._get_genres_sorted_movies_from_storage,
+            order,
+            sorted_field,
+            page_number,
+            page_size,
+            genre,
+            search_after,
+            fresh=fresh
+            )
+
+    # страница главной: устаревшая отдаётся сразу и обновляется в фоне;
+    # с fresh (прогрев) пересборка устаревшей страницы дожидается
+    async def _get_index_page(
+            self,
+            key: str,
+            from_storage,
+            *args,
+            fresh: bool = False
+            ) -> Optional[Page]:
+        if not self.swr:
+            movies = await self._find_movies_from_cache(key)
+            if not movies:
+                movies = await self.single_flight.do(
+                    key,
+                    partial(
+                        self._load_movies,
+                        key,
+                        SORTED_MOVIES_CACHE_EXPIRE_IN_SECONDS,
+                        from_storage,
+                        *args
+                        ),
+                    partial(self._find_movies_from_cache, key)
                     )
-            if not genres_sorted_movies:
-                return None
-            await self._put_find_movies_to_cache(
-                key=f'{genre}_{page_number}_{page_size}',
-                find_movies=genres_sorted_movies
+            return movies
+
+        movies, stale = await self._index_page_from_cache(key)
+        load = partial(self._load_index_page, key, from_storage, *args)
+        if not movies:
+            return await self.single_flight.do(
+                key,
+                load,
+                partial(self._any_index_page_from_cache, key)
                 )
-        return genres_sorted_movies
+        if stale and fresh:
+            return await self.single_flight.do(
+                key,
+                load,
+                partial(self._fresh_index_page_from_cache, key)
+                )
+        if stale:
+            self.single_flight.spawn(
+                key,
+                load,
+                partial(self._fresh_index_page_from_cache, key)
+                )
+        return movies
+
+    async def _load_index_page(
+            self,
+            key: str,
+            from_storage,
+            *args
+            ) -> Optional[Page]:
+        movies, cursor = await from_storage(*args) or ([], None)
+        if not movies:
+            return None
+        page = Page(self._movies_to_json(movies), cursor)
+        await self.cache.set_swr(
+            key,
+            pack_page(page),
+            SORTED_MOVIES_CACHE_EXPIRE_IN_SECONDS,
+            SORTED_MOVIES_STALE_EXPIRE_IN_SECONDS
+            )
+        cache_logger.info(
+            'Movies by %s put into redis for %s seconds',
+            key,
+            SORTED_MOVIES_CACHE_EXPIRE_IN_SECONDS
+            )
+        return page
+
+    async def _index_page_from_cache(
+            self,
+            key: str
+            ) -> Tuple[Optional[Page], bool]:
+        values, stale = await self.cache.get_swr(
+            key,
+            SORTED_MOVIES_STALE_EXPIRE_IN_SECONDS
+            )
+        if not values:
+            return None, False
+        cache_logger.info(
+            'Movies by %s get from redis, stale: %s',
+            key,
+            stale
+            )
+        return unpack_page(values), stale
+
+    async def _any_index_page_from_cache(
+            self,
+            key: str
+            ) -> Optional[Page]:
+        movies, _ = await self._index_page_from_cache(key)
+        return movies
 
-    async def _get_genres_sorted_movies_from_elastic(
+    async def _fresh_index_page_from_cache(
+            self,
+            key: str
+            ) -> Optional[Page]:
+        movies, stale = await self._index_page_from_cache(key)
+        return None if stale else movies
+
+    async def _get_genres_sorted_movies_from_storage(
             self,
             order: str,
             sorted_field: str,
             page_number: int,
             page_size: int,
-            genre: uuid.UUID
-            ) -> Optional[List[MovieShort]]:
-        try:
-            body = genre_sorted_movie_query(
-                order,
-                sorted_field,
-                page_number,
-                page_size,
-                genre
-                )
-            response = await self.elastic.search(
-                body=body,
-                index='movies',
-                size=page_size
-                )
-            logger.info(
-                'Movies list with order {0} and genre {2} \
-                   sorted on {1} request from ES'.format(
-                    order,
-                    sorted_field,
-                    genre)
+            genre: uuid.UUID,
+            search_after: Optional[list] = None
+            ) -> Optional[Tuple[List[MovieShort], Optional[str]]]:
+        movies = await self._sorted_movies_from_index(
+            order,
+            sorted_field,
+            page_number,
+            page_size,
+            str(genre),
+            search_after
+            )
+        if movies is not None:
+            return movies
+        body = genre_sorted_movie_query(
+            order,
+            sorted_field,
+            page_number,
+            page_size,
+            genre,
+            search_after
+            )
+        docs = await self.storage.search('movies', body)
+        if docs is None:
+            return None
+        logger.info(
+            'Movies list with order %s and genre %s sorted on %s '
+            'request from ES',
+            order,
+            genre,
+            sorted_field
+            )
+        return self._movies_from_docs(
+            docs,
+            page_size,
+            cursor_sort(order, sorted_field)
             )
-            docs = response['hits']['hits']
-            sorted_senres_movies = []
-            for doc in docs:
-                sorted_senres_movies.append(MovieShort(
-                    uuid=doc['_source']['id'],
-                    imdb_rating=doc['_source']['imdb_rating'],
-                    title=doc['_source']['title']
-                    )
-                )
 
-        except NotFoundError:
+    # срез готового порядка (services/sorted_index.py); None - индекс ещё
+    # не построен или поле не поддерживается, страница запрашивается у ES
+    async def _sorted_movies_from_index(
+            self,
+            order: str,
+            sorted_field: str,
+            page_number: int,
+            page_size: int,
+            genre: Optional[str] = None,
+            search_after: Optional[list] = None
+            ) -> Optional[Tuple[List[MovieShort], Optional[str]]]:
+        index = await self.sorted_indexes.get()
+        if index is None:
             return None
-        return sorted_senres_movies
+        page = index.page(
+            order,
+            sorted_field,
+            page_number,
+            page_size,
+            genre,
+            search_after
+            )
+        if page is None:
+            return None
+        with timed(VALIDATION):
+            movies = [
+                MovieShort(
+                    uuid=row.id,
+                    imdb_rating=row.imdb_rating,
+                    title=row.title
+                    )
+                for row, _ in page
+                ]
+        cursor = None
+        if len(page) == page_size:
+            cursor = encode_cursor(
+                cursor_sort(order, sorted_field),
+                page[-1][1]
+                )
+        return movies, cursor
 
-    # забрать / получить фильмы по запросу из redis
+    # забрать / получить фильмы по запросу из redis: готовое тело ответа
     async def _find_movies_from_cache(
             self,
             key: str
-            ) -> Optional[List[str]]:
-        values = await self.redis.get(key)
+            ) -> Optional[Page]:
+        values = await self.cache.get(
+            key,
+            SORTED_MOVIES_CACHE_EXPIRE_IN_SECONDS
+            )
         if not values:
             return None
-        values = orjson.loads(values)
-        data = []
-        for movie in values:
-            data.append(MovieShort.parse_raw(movie))
-        logger.info('Movies by {0} get from redis'.format(key))
-        return data
+        cache_logger.info('Movies by %s get from redis', key)
+        return unpack_page(values)
 
     async def _put_find_movies_to_cache(
             self,
             key: str,
-            find_movies: Optional[List[MovieShort]]
-            ):
-        values = []
-        for movie in find_movies:
-            values.append(movie.json())
-        await self.redis.set(
+            find_movies: List[MovieShort],
+            cursor: Optional[str] = None,
+            ttl: int = SORTED_MOVIES_CACHE_EXPIRE_IN_SECONDS
+            ) -> Page:
+        page = Page(self._movies_to_json(find_movies), cursor)
+        await self.cache.set(key, pack_page(page), ttl)
+        cache_logger.info(
+            'Movies by %s put into redis for %s seconds',
             key,
-            orjson_dumps(values, default='default'),
-            SORTED_MOVIES_CACHE_EXPIRE_IN_SECONDS
+            ttl
             )
-        logger.info(
-            'Movies by {0} put into redis for {1} seconds'.format(
-                key,
-                SORTED_MOVIES_CACHE_EXPIRE_IN_SECONDS
+        return page
+
+    # страница ES: краткие фильмы и курсор следующей страницы
+    @staticmethod
+    def _movies_from_docs(
+            docs: List[dict],
+            page_size: int,
+            sort: str
+            ) -> Tuple[List[MovieShort], Optional[str]]:
+        movies = []
+        with timed(VALIDATION):
+            for doc in docs:
+                movies.append(MovieShort(
+                    uuid=doc['_source']['id'],
+                    imdb_rating=doc['_source'].get('imdb_rating'),
+                    title=doc['_source']['title']
+                    )
                 )
-            )
+        return movies, next_cursor(docs, page_size, sort)
+
+    # тело ответа List[MovieShort] сериализуется один раз, при промахе
+    @staticmethod
+    def _movies_to_json(movies: List[MovieShort]) -> bytes:
+        with timed(SERIALIZATION):
+            return orjson.dumps([movie.dict() for movie in movies])
 
 
 @lru_cache()
 def get_movie_service(
-        redis: Redis = Depends(get_redis),
-        elastic: AsyncElasticsearch = Depends(get_elastic),
+        store: Store = Depends(get_store),
+        storage: Storage = Depends(get_storage),
 ) -> MovieService:
-    return MovieService(redis, elastic)
+    return MovieService(store, storage)
@@ -0,0 +1,103 @@
+""" Курсорная пагинация (search_after) и формат страниц списков в кэше """
+import base64
+import math
+from typing import List, NamedTuple, Optional
+
+import orjson
+
+# значение сортируемого поля и id - tiebreaker
+CURSOR_LENGTH = 2
+# значение поля: число, строка или null у документа без значения
+SORT_VALUE_TYPES = (str, int, float, type(None))
+
+
+class InvalidCursor(ValueError):
+    """Курсор испорчен или выдан для другой сортировки"""
+
+
+class Page(NamedTuple):
+    # готовое тело ответа
+    body: bytes
+    # курсор следующей страницы, None - следующей страницы нет
+    cursor: Optional[str] = None
+
+
+# список и сортировка, для которых выдан курсор: "movies:desc:imdb_rating"
+def cursor_sort(
+        order: str,
+        sorted_field: str,
+        entity: str = 'movies'
+        ) -> str:
+    return '{0}:{1}:{2}'.format(entity, order, sorted_field)
+
+
+# поиск фильмов и персон - по релевантности
+MOVIES_SCORE_SORT = cursor_sort('desc', '_score')
+PERSONS_SCORE_SORT = cursor_sort('desc', '_score', 'persons')
+
+
+def encode_cursor(sort: str, sort_values: list) -> str:
+    return _encode([sort] + sort_values)
+
+
+def decode_cursor(cursor: str, sort: str) -> list:
+    """Значения sort последнего документа.
+
+    InvalidCursor, если курсор испорчен или выдан для другой сортировки.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = orjson.loads(base64.urlsafe_b64decode(padded))
+    except ValueError as exc:
+        raise InvalidCursor('invalid cursor') from exc
+    if not isinstance(payload, list) or len(payload) != CURSOR_LENGTH + 1:
+        raise InvalidCursor('invalid cursor')
+    if payload[0] != sort:
+        raise InvalidCursor('cursor of another list')
+    value, last_id = payload[1:]
+    if not isinstance(value, SORT_VALUE_TYPES) or \
+            not isinstance(last_id, str):
+        raise InvalidCursor('invalid cursor values')
+    return payload[1:]
+
+
+def next_cursor(
+        docs: List[dict],
+        page_size: int,
+        sort: str
+        ) -> Optional[str]:
+    if len(docs) < page_size or 'sort' not in docs[-1]:
+        return None
+    return encode_cursor(sort, docs[-1]['sort'])
+
+
+# часть ключа кэша, задающая страницу
+def page_key(page_number: int, search_after: Optional[list]) -> str:
+    if search_after is None:
+        return str(page_number)
+    return 'after_' + _encode(search_after)
+
+
+def _encode(values: list) -> str:
+    # у документов без значения поля ES сортирует по +-Infinity,
+    # в JSON их можно передать только строкой
+    values = [
+        ('Infinity' if value > 0 else '-Infinity')
+        if isinstance(value, float) and math.isinf(value) else value
+        for value in values
+        ]
+    token = base64.urlsafe_b64encode(orjson.dumps(values))
+    return token.decode().rstrip('=')
+
+
+# в кэше страница хранится как "<курсор>\n<тело>"
+def pack_page(page: Page) -> bytes:
+    return (page.cursor or '').encode() + b'\n' + page.body
+
+
+def unpack_page(value: bytes) -> Page:
+    cursor, sep, body = value.partition(b'\n')
+    if not sep:
+        # запись без курсора (старый формат) - только тело
+        return Page(value)
+    return Page(body, cursor.decode() or None)
@@ -1,214 +1,393 @@
 from http import HTTPStatus
 from collections import defaultdict
-from functools import lru_cache
-from typing import List, Optional
+from functools import lru_cache, partial
+from typing import Dict, List, Optional, Tuple
 
-from elasticsearch import AsyncElasticsearch, NotFoundError
 from fastapi import Depends, HTTPException
-
-from redis.asyncio import Redis
 import orjson
 
-from db.elastic import get_elastic
-from db.redis import get_redis
-from models.role import Role
+from db.storage import Storage, get_storage
+from db.store import Store, get_store
+from models.person import PersonDoc
 from schemas.person import Person, MovieRoles
 from schemas.movie_short import MovieShort
-from models._orjson import orjson_dumps
 from services.movie import MovieService
+from services.cache.versions import get_versioned_cache
+from services.cache.keys import item_key, list_key, normalize_query
+from services.cache.popularity import get_popularity
+from services.cache.single_flight import get_single_flight
+from services.pagination import Page, PERSONS_SCORE_SORT, next_cursor, \
+    page_key, pack_page, unpack_page
 from services.query_to_es.search_person import search_person_query
 from services.query_to_es.roles_from_movie import search_roles_from_movie
-from core.get_logger import get_logger
+from core.get_logger import get_cache_logger, get_logger
+from core.timing import SERIALIZATION, VALIDATION, timed
 
 
-PERSON_CACHE_EXPIRE_IN_SECONDS = 5 * 60  # 5 минут
-FIND_PERSONS_CACHE_EXPIRE_IN_SECONDS = 60  # 1 минута
+PERSON_CACHE_EXPIRE_IN_SECONDS = 24 * 60 * 60  # 1 сутки
+# популярные запросы живут дольше (services/cache/popularity.py)
+FIND_PERSONS_CACHE_EXPIRE_IN_SECONDS = 60 * 60  # 1 час
+ROLES_PAGE_SIZE = 500  # фильмов за один запрос ролей
 logger = get_logger()
+# чтение и запись redis на каждый запрос - выборочно
+cache_logger = get_cache_logger()
 
 
 class PersonService:
-    def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
-        self.redis = redis
-        self.elastic = elastic
+    def __init__(self, store: Store, storage: Storage):
+        self.storage = storage
+        # роли персон строятся по индексу movies
+        self.cache = get_versioned_cache(store, 'persons', 'movies')
+        self.single_flight = get_single_flight(store)
+        self.popularity = get_popularity(store)
 
     # persons/{uuid}
     async def get_by_id(self, person_id: str) -> Optional[Person]:
-        person = await self._person_from_cache(person_id)
-        if not person:
-            role = await self._get_person_from_elastic(person_id)
-            if not role:
-                return None
-            movie_roles = await self._get_movie_roles_from_elastic(person_id)
+        data = await self.get_raw_by_id(person_id)
+        if not data:
+            return None
+        with timed(VALIDATION):
+            return Person.parse_raw(data)
+
+    # готовое тело ответа persons/{uuid} из кэша
+    async def get_raw_by_id(self, person_id: str) -> Optional[bytes]:
+        data = await self._person_from_cache(person_id)
+        if not data:
+            data = await self.single_flight.do(
+                item_key('persons', person_id),
+                partial(self._load_person, person_id),
+                partial(self._person_from_cache, person_id)
+                )
+        return data
+
+    async def _load_person(self, person_id: str) -> Optional[bytes]:
+        role = await self._get_person_from_storage(person_id)
+        if not role:
+            return None
+        movie_roles = self._materialized_movie_roles(role)
+        if movie_roles is None:
+            movie_roles = await self._get_movie_roles_from_storage(person_id)
+        with timed(VALIDATION):
             person = Person(
                 uuid=role.id,
                 full_name=role.full_name,
                 movies=movie_roles)
-            await self._put_person_to_cache(person)
-        return person
+        return await self._put_person_to_cache(person)
 
-    async def _get_person_from_elastic(
+    async def _get_person_from_storage(
             self,
             person_id: str
-            ) -> Optional[Role]:
-        try:
-            doc = await self.elastic.get('person', person_id)
-        except NotFoundError:
+            ) -> Optional[PersonDoc]:
+        source = await self.storage.get('person', person_id)
+        if not source:
             return None
-        logger.info('Person {0} request from ES'.format(person_id))
-        return Role(**doc['_source'])
+        logger.info('Person %s request from storage', person_id)
+        with timed(VALIDATION):
+            return PersonDoc(**source)
 
-    async def _get_movie_roles_from_elastic(
+    # роли из документа person, если хранилище строит фильмографию
+    def _materialized_movie_roles(
+            self,
+            role: PersonDoc
+            ) -> Optional[List[MovieRoles]]:
+        if not self.storage.materialized or role.movies is None:
+            return None
+        with timed(VALIDATION):
+            return [
+                MovieRoles(uuid=movie.id, roles=movie.roles)
+                for movie in role.movies
+                ]
+
+    async def _get_movie_roles_from_storage(
             self,
             person_id: str
             ) -> Optional[List[MovieRoles]]:
-        try:
-            body = search_roles_from_movie(person_id)
-            response = (await self.elastic.search(
-                body=body,
-                index='movies',
-                size=100
-                ))['hits']['hits']
-            movie_by_person = defaultdict(list)
-
-            # наполнение ролями каждый фильм Персоны
-            for movie in response:  # по найденным Movie
-                for role in movie['_source']:  # из найденых ролей
-                    for person in movie['_source'][role]:  # из всех id
-                        if person_id == person['id']:  # добавляй подходящие
-                            movie_by_person[movie['_id']].append(role)
-
-            # валидируем данные
-            movie_roles = []
-            for id, roles in movie_by_person.items():
-                movie_roles.append(MovieRoles(**{'uuid': id, 'roles': roles}))
-
-        except NotFoundError:
+        movie_roles = await self._get_persons_movie_roles_from_storage(
+            [person_id]
+            )
+        if movie_roles is None:
             return None
-        logger.info("Movie list person's {0} request from ES".format(
-            person_id
+        return movie_roles.get(person_id, [])
+
+    # роли сразу нескольких персон: inner_hits отдают по каждому фильму
+    # только совпавшие роли, фильмография обходится страницами
+    async def _get_persons_movie_roles_from_storage(
+            self,
+            person_ids: List[str]
+            ) -> Optional[Dict[str, List[MovieRoles]]]:
+        movie_by_person = defaultdict(lambda: defaultdict(list))
+        search_after = None
+        while True:
+            body = search_roles_from_movie(
+                person_ids,
+                ROLES_PAGE_SIZE,
+                search_after
+                )
+            docs = await self.storage.search('movies', body)
+            if docs is None:
+                return None
+            for movie in docs:
+                for role, found in movie.get('inner_hits', {}).items():
+                    for person in found['hits']['hits']:
+                        movie_by_person[person['_source']['id']][
+                            movie['_id']
+                            ].append(role)
+            if len(docs) < ROLES_PAGE_SIZE:
+                break
+            search_after = docs[-1]['sort']
+        logger.info(
+            'Movie list of %s persons request from ES',
+            len(person_ids)
             )
-        )
-        return movie_roles
+        # валидируем данные
+        with timed(VALIDATION):
+            return {
+                person_id: [
+                    MovieRoles(**{'uuid': id, 'roles': roles})
+                    for id, roles in movie_by_person[person_id].items()
+                    ]
+                for person_id in person_ids
+                }
 
-    async def _person_from_cache(self, person_id: str) -> Optional[Person]:
-        data = await self.redis.get(person_id)
+    # несколько персон: MGET в redis, mget хранилища и поиск ролей в ES
+    # для тех, у кого фильмография не построена
+    async def get_by_ids(self, person_ids: List[str]) -> List[Person]:
+        if not person_ids:
+            return []
+        persons = await self._persons_by_ids_from_cache(person_ids)
+        missing = [id for id in person_ids if id not in persons]
+        if missing:
+            roles = await self._get_persons_from_storage(missing)
+            movie_roles = {
+                id: self._materialized_movie_roles(role)
+                for id, role in roles.items()
+                }
+            pending = [
+                id for id, movies in movie_roles.items() if movies is None
+                ]
+            if pending:
+                searched = await self._get_persons_movie_roles_from_storage(
+                    pending
+                    ) or {}
+                movie_roles.update(searched)
+            with timed(VALIDATION):
+                found = [
+                    Person(
+                        uuid=role.id,
+                        full_name=role.full_name,
+                        movies=movie_roles[id]
+                        )
+                    for id, role in roles.items()
+                    if movie_roles[id] is not None
+                    ]
+            if found:
+                await self._put_persons_to_cache(found)
+                for person in found:
+                    persons[str(person.uuid)] = person
+        # порядок как в выдаче ES, ненайденных пропускаем
+        return [persons[id] for id in person_ids if id in persons]
+
+    async def _get_persons_from_storage(
+            self,
+            person_ids: List[str]
+            ) -> Dict[str, PersonDoc]:
+        sources = await self.storage.mget('person', person_ids)
+        logger.info('%s persons request from storage', len(person_ids))
+        with timed(VALIDATION):
+            return {
+                id: PersonDoc(**source) for id, source in sources.items()
+                }
+
+    async def _persons_by_ids_from_cache(
+            self,
+            person_ids: List[str]
+            ) -> Dict[str, Person]:
+        values = await self.cache.mget(
+            [item_key('persons', person_id) for person_id in person_ids],
+            PERSON_CACHE_EXPIRE_IN_SECONDS
+            )
+        with timed(VALIDATION):
+            persons = {
+                person_id: Person.parse_raw(data)
+                for person_id, data in zip(person_ids, values) if data
+                }
+        cache_logger.info(
+            '%s of %s persons get from redis',
+            len(persons),
+            len(person_ids)
+            )
+        return persons
+
+    async def _put_persons_to_cache(self, persons: List[Person]):
+        with timed(SERIALIZATION):
+            items = {
+                item_key('persons', person.uuid): person.json()
+                for person in persons
+                }
+        await self.cache.mset(items, PERSON_CACHE_EXPIRE_IN_SECONDS)
+        cache_logger.info(
+            '%s persons put into redis for %s seconds',
+            len(persons),
+            PERSON_CACHE_EXPIRE_IN_SECONDS
+            )
+
+    async def _person_from_cache(self, person_id: str) -> Optional[bytes]:
+        data = await self.cache.get(
+            item_key('persons', person_id),
+            PERSON_CACHE_EXPIRE_IN_SECONDS
+            )
         if not data:
             return None
-        person = Person.parse_raw(data)
-        logger.info('Person {0} get from redis'.format(person_id))
-        return person
-
-    async def _put_person_to_cache(self, person):
-        await self.redis.set(
-            str(person.uuid),
-            person.json(),
+        cache_logger.info('Person %s get from redis', person_id)
+        return data
+
+    async def _put_person_to_cache(self, person: Person) -> bytes:
+        with timed(SERIALIZATION):
+            data = person.json().encode()
+        await self.cache.set(
+            item_key('persons', person.uuid),
+            data,
             PERSON_CACHE_EXPIRE_IN_SECONDS
             )
-        logger.info(
-            'Person {0} put into redis for {1} seconds'.format(
-                str(person.uuid),
-                PERSON_CACHE_EXPIRE_IN_SECONDS
-                )
+        cache_logger.info(
+            'Person %s put into redis for %s seconds',
+            person.uuid,
+            PERSON_CACHE_EXPIRE_IN_SECONDS
             )
+        return data
 
     # persons/search
     async def get_find_persons(
             self,
             query: str,
             page_number: int,
-            page_size: int
-            ) -> Optional[List[Person]]:
-        find_persons = await self._find_persons_from_cache(
-            key=f'{query}_{page_number}_{page_size}'
+            page_size: int,
+            search_after: Optional[list] = None
+            ) -> Optional[Page]:
+        # ключ кэша и счётчик - по нормализованному запросу, а в ES
+        # запрос уходит как есть: title.raw различает регистр
+        normalized = normalize_query(query)
+        query = query.strip()
+        key = list_key(
+            'persons',
+            'search',
+            query=normalized,
+            page=page_key(page_number, search_after),
+            size=page_size
             )
+        # попадание в L1 не ходит в redis и популярность не считает
+        counter = None
+        if not await self.cache.in_local(key):
+            counter = self.popularity.touch('persons', normalized)
+        find_persons = await self._find_persons_from_cache(key)
         if not find_persons:
-            find_id = await self.get_find_persons_from_elastic(
-                query,
-                page_number,
-                page_size
+            ttl = await self.popularity.ttl(
+                counter,
+                FIND_PERSONS_CACHE_EXPIRE_IN_SECONDS
                 )
-            find_persons = []
-            for id in find_id:
-                find_persons.append(await self.get_by_id(id))
+            find_persons = await self.single_flight.do(
+                key,
+                partial(
+                    self._load_find_persons,
+                    key,
+                    ttl,
+                    query,
+                    page_number,
+                    page_size,
+                    search_after
+                    ),
+                partial(self._find_persons_from_cache, key)
+                )
+        return find_persons
 
+    async def _load_find_persons(
+            self,
+            key: str,
+            ttl: int,
+            query: str,
+            page_number: int,
+            page_size: int,
+            search_after: Optional[list] = None
+            ) -> Optional[Page]:
+        find_id, cursor = await self.get_find_persons_from_storage(
+            query,
+            page_number,
+            page_size,
+            search_after
+            ) or ([], None)
+        find_persons = await self.get_by_ids(find_id)
         if not find_persons:
             return None
-        await self._put_find_persons_to_cache(
-            key=f'{query}_{page_number}_{page_size}',
-            find_persons=find_persons)
-        return find_persons
+        return await self._put_find_persons_to_cache(
+            key=key,
+            find_persons=find_persons,
+            cursor=cursor,
+            ttl=ttl
+            )
 
-    async def get_find_persons_from_elastic(
+    async def get_find_persons_from_storage(
             self,
             query: str,
             page_number: int,
-            page_size: int
-            ) -> Optional[List[str]]:
-        try:
-            find_id = []
-            body = search_person_query(query, page_number, page_size)
-            response = await self.elastic.search(
-                body=body,
-                index='person',
-                size=page_size
-                )
-            logger.info(
-                'Persons list on demand {0} request from ES'.format(query)
+            page_size: int,
+            search_after: Optional[list] = None
+            ) -> Optional[Tuple[List[str], Optional[str]]]:
+        body = search_person_query(
+            query,
+            page_number,
+            page_size,
+            search_after
             )
-            docs = response['hits']['hits']
-            find_id = []
-            for doc in docs:
-                find_id.append(doc['_id'])
-
-        except NotFoundError:
+        docs = await self.storage.search('person', body)
+        if docs is None:
             return None
-        return find_id
+        logger.info('Persons list on demand %s request from ES', query)
+        find_id = []
+        for doc in docs:
+            find_id.append(doc['_id'])
+        return find_id, next_cursor(docs, page_size, PERSONS_SCORE_SORT)
 
     async def _find_persons_from_cache(
             self,
             key: str
-            ) -> Optional[List[Person]]:
-        values = await self.redis.get(key)
+            ) -> Optional[Page]:
+        values = await self.cache.get(
+            key,
+            FIND_PERSONS_CACHE_EXPIRE_IN_SECONDS
+            )
         if not values:
             return None
-        values = orjson.loads(values)
-        data = []
-        for person in values:
-            data.append(Person.parse_raw(person))
-        logger.info('Persons list by {0} get from redis'.format(key))
-        return data
+        cache_logger.info('Persons list by %s get from redis', key)
+        return unpack_page(values)
 
+    # в redis кладётся готовое тело ответа List[Person]
     async def _put_find_persons_to_cache(
             self,
             key: str,
-            find_persons: Optional[List[Person]]
-            ):
-        values = []
-        for person in find_persons:
-            values.append(person.json())
-
-        await self.redis.set(
+            find_persons: List[Person],
+            cursor: Optional[str] = None,
+            ttl: int = FIND_PERSONS_CACHE_EXPIRE_IN_SECONDS
+            ) -> Page:
+        with timed(SERIALIZATION):
+            data = orjson.dumps([person.dict() for person in find_persons])
+        page = Page(data, cursor)
+        await self.cache.set(key, pack_page(page), ttl)
+        cache_logger.info(
+            'Persons list by %s put into redis for %s seconds',
             key,
-            orjson_dumps(values, default='default'),
-            FIND_PERSONS_CACHE_EXPIRE_IN_SECONDS
-            )
-        logger.info(
-            'Persons list by {0} put into redis for {1} seconds'.format(
-                key,
-                FIND_PERSONS_CACHE_EXPIRE_IN_SECONDS
-                )
+            ttl
             )
+        return page
 
     # persons/<uuid>/movies
     async def get_movies_by_person(
             self,
             uuid: str,
             movie_service: MovieService
-            ) -> Optional[List[Person]]:
+            ) -> Optional[Page]:
 
-        response_movies = await movie_service._find_movies_from_cache(
-            uuid+'_movies'
-            )
+        key = list_key('persons', 'movies', person=uuid)
+        response_movies = await self._filmography_from_cache(key)
         if not response_movies:
             person = await self.get_by_id(uuid)  # Person
             if not person:
@@ -221,26 +400,55 @@ class PersonService:
                     status_code=HTTPStatus.NOT_FOUND,
                     detail='Movies by {} not found'.format(person.full_name)
                     )
-            response_movies = []
-            for id in movie_id:
-                movie = await movie_service.get_by_id(id)
-                movie_by_person = MovieShort(
-                    uuid=movie.id,
-                    imdb_rating=movie.imdb_rating,
-                    title=movie.title
-                    )
-                response_movies.append(movie_by_person)
+            movies_by_person = []
+            movies = await movie_service.get_by_ids(movie_id)
+            with timed(VALIDATION):
+                for movie in movies:
+                    movie_by_person = MovieShort(
+                        uuid=movie.id,
+                        imdb_rating=movie.imdb_rating,
+                        title=movie.title
+                        )
+                    movies_by_person.append(movie_by_person)
 
-        await movie_service._put_find_movies_to_cache(
-            uuid+'_movies',
-            response_movies
-            )
+            response_movies = await self._put_filmography_to_cache(
+                key,
+                movies_by_person
+                )
         return response_movies
 
+    # фильмография зависит от пространств persons и movies, как и self.cache
+    async def _filmography_from_cache(self, key: str) -> Optional[Page]:
+        values = await self.cache.get(key, PERSON_CACHE_EXPIRE_IN_SECONDS)
+        if not values:
+            return None
+        cache_logger.info('Movies by %s get from redis', key)
+        return unpack_page(values)
+
+    # в redis кладётся готовое тело ответа List[MovieShort]
+    async def _put_filmography_to_cache(
+            self,
+            key: str,
+            movies: List[MovieShort]
+            ) -> Page:
+        with timed(SERIALIZATION):
+            page = Page(orjson.dumps([movie.dict() for movie in movies]))
+        await self.cache.set(
+            key,
+            pack_page(page),
+            PERSON_CACHE_EXPIRE_IN_SECONDS
+            )
+        cache_logger.info(
+            'Movies by %s put into redis for %s seconds',
+            key,
+            PERSON_CACHE_EXPIRE_IN_SECONDS
+            )
+        return page
+
 
 @lru_cache()
 def get_person_service(
-        redis: Redis = Depends(get_redis),
-        elastic: AsyncElasticsearch = Depends(get_elastic),
+        store: Store = Depends(get_store),
+        storage: Storage = Depends(get_storage),
 ) -> PersonService:
-    return PersonService(redis, elastic)
+    return PersonService(store, storage)
@@ -0,0 +1,2 @@
+# поля _source, которые нужны схеме schemas.movie_short.MovieShort
+MOVIE_SHORT_FIELDS = ["id", "title", "imdb_rating"]
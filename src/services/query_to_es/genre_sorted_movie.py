@@ -1,15 +1,20 @@
+from typing import Optional
 import uuid
 
+from services.query_to_es.fields import MOVIE_SHORT_FIELDS
+from services.query_to_es.pagination import pagination
+
 
 def genre_sorted_movie_query(
         order: str,
         sorted_field: str,
         page_number: int,
         page_size: int,
-        genre: uuid.UUID):
+        genre: uuid.UUID,
+        search_after: Optional[list] = None):
     return  {
-              "from": str((page_number-1) * page_size),
-              "size": str(page_size),
+              **pagination(page_number, page_size, search_after),
+              "_source": MOVIE_SHORT_FIELDS,
               "query": {
                 "bool": {
                   "must": [
@@ -30,6 +35,12 @@ def genre_sorted_movie_query(
                   sorted_field: {
                     "order": order
                   }
+                },
+                # tiebreaker для search_after
+                {
+                  "id": {
+                    "order": "asc"
+                  }
                 }
               ]
             }
@@ -0,0 +1,17 @@
+from typing import Optional
+
+
+def pagination(
+        page_number: int,
+        page_size: int,
+        search_after: Optional[list] = None
+        ):
+    if search_after is not None:
+        return {
+                 "size": str(page_size),
+                 "search_after": search_after
+               }
+    return {
+             "from": str((page_number-1) * page_size),
+             "size": str(page_size)
+           }
@@ -1,6 +1,21 @@
-def search_roles_from_movie(person_id):
+from typing import List, Optional
+
+from services.query_to_es.pagination import pagination
+
+# сколько персон запроса может встретиться в одной роли одного фильма,
+# не больше index.max_inner_result_window
+INNER_HITS_MAX_SIZE = 100
+
+
+def search_roles_from_movie(
+        person_ids: List[str],
+        page_size: int,
+        search_after: Optional[list] = None
+        ):
+    inner_size = min(len(person_ids), INNER_HITS_MAX_SIZE)
     return \
 {
+**pagination(1, page_size, search_after),
 "query": {
   "bool": {
     "should": [
@@ -8,11 +23,15 @@ def search_roles_from_movie(person_id):
       "nested": {
         "path": "actors",
         "query": {
-          "term": {
-            "actors.id": {
-              "value": person_id
-            }
+          "terms": {
+            "actors.id": person_ids
           }
+        },
+        # ES вернёт по фильму только совпавших персон в этой роли
+        "inner_hits": {
+          "name": "actors",
+          "size": inner_size,
+          "_source": ["actors.id"]
         }
       }
     },
@@ -20,11 +39,14 @@ def search_roles_from_movie(person_id):
       "nested": {
         "path": "directors",
         "query": {
-          "term": {
-            "directors.id": {
-              "value": person_id
-            }
+          "terms": {
+            "directors.id": person_ids
           }
+        },
+        "inner_hits": {
+          "name": "directors",
+          "size": inner_size,
+          "_source": ["directors.id"]
         }
       }
     },
@@ -32,11 +54,14 @@ def search_roles_from_movie(person_id):
       "nested": {
         "path": "writers",
         "query": {
-          "term": {
-            "writers.id": {
-              "value": person_id
-            }
+          "terms": {
+            "writers.id": person_ids
           }
+        },
+        "inner_hits": {
+          "name": "writers",
+          "size": inner_size,
+          "_source": ["writers.id"]
         }
       }
     }
@@ -44,5 +69,7 @@ def search_roles_from_movie(person_id):
     "minimum_should_match":1
     }
   },
-  "_source": ["actors.id", "directors.id", "writers.id"]
+  "_source": False,
+  # постраничный обход всей фильмографии через search_after
+  "sort": [{"id": {"order": "asc"}}]
 }
@@ -1,12 +1,19 @@
+from typing import Optional
+
+from services.query_to_es.fields import MOVIE_SHORT_FIELDS
+from services.query_to_es.pagination import pagination
+
+
 def search_movie_query(
         query: str,
         page_number: int,
-        page_size: int
+        page_size: int,
+        search_after: Optional[list] = None
         ):
     return \
         {
-          "from": str((page_number-1) * page_size),
-          "size": str(page_size),
+          **pagination(page_number, page_size, search_after),
+          "_source": MOVIE_SHORT_FIELDS,
           "query": {
             "multi_match": {
               "query": query,
@@ -19,5 +26,10 @@ def search_movie_query(
                 # допускаем одну опечатку
                 "fuzziness": 1
             }
-          }
+          },
+          # по релевантности, id - tiebreaker для search_after
+          "sort": [
+            {"_score": {"order": "desc"}},
+            {"id": {"order": "asc"}}
+          ]
         }
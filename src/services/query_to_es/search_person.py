@@ -1,14 +1,26 @@
+from typing import Optional
+
+from services.query_to_es.pagination import pagination
+
+
 def search_person_query(
         query: str,
         page_number: int,
-        page_size: int
+        page_size: int,
+        search_after: Optional[list] = None
         ):
     return {
-              "from": str((page_number-1) * page_size),
-              "size": str(page_size),
+              **pagination(page_number, page_size, search_after),
+              # нужны только id найденных персон
+              "_source": False,
               "query": {
                   "match": {
                     "full_name": query
                   }
-              }
+              },
+              # по релевантности, id - tiebreaker для search_after
+              "sort": [
+                {"_score": {"order": "desc"}},
+                {"id": {"order": "asc"}}
+              ]
             }
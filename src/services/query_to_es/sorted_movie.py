@@ -1,17 +1,30 @@
+from typing import Optional
+
+from services.query_to_es.fields import MOVIE_SHORT_FIELDS
+from services.query_to_es.pagination import pagination
+
+
 def sorted_movie_query(
         order: str,
         sorted_field: str,
         page_number: int,
-        page_size: int
+        page_size: int,
+        search_after: Optional[list] = None
         ):
     return \
-        { "from": str((page_number-1) * page_size),
-          "size": str(page_size),
+        { **pagination(page_number, page_size, search_after),
+          "_source": MOVIE_SHORT_FIELDS,
           "sort": [
             {
               sorted_field: {
                 "order": order
               }
+            },
+            # tiebreaker для search_after
+            {
+              "id": {
+                "order": "asc"
+              }
             }
           ]
         }
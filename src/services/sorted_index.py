@@ -0,0 +1,212 @@
+""" Готовые порядки фильмов для страниц главной
+
+Для всех фильмов и для каждого жанра, для каждого поля и направления
+сортировки заранее хранится отсортированный массив id. Страница главной -
+срез массива: рейтинг и название фильма для краткой карточки лежат в самом
+индексе, без сортировки и вложенного запроса по жанру в ES на каждый
+промах кэша.
+
+Индекс строится обходом индекса movies в хранилище документов
+(db/storage.py) и перестраивается после смены версии пространства movies,
+то есть после перезаливки индексов (services/cache/versions.py).
+"""
+import asyncio
+from collections import defaultdict
+from functools import lru_cache
+import math
+import struct
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from core.get_logger import get_logger
+from db.storage import Storage
+from db.store import Store
+from services.cache.versions import Versions, get_versions
+
+ORDERS = ('asc', 'desc')
+SOURCE_FIELDS = ['id', 'imdb_rating', 'title', 'genre.id']
+# пауза перед новой попыткой после неудачной сборки, секунды
+RETRY_AFTER = 30
+FLOAT = struct.Struct('f')
+logger = get_logger()
+
+
+class SortRow(NamedTuple):
+    id: str
+    imdb_rating: Optional[float]
+    title: str
+    genres: Tuple[str, ...]
+
+
+# imdb_rating в ES - float: в sort он приходит округлённым до float32,
+# так курсоры индекса и ES взаимозаменяемы
+def _float32(value: float) -> float:
+    return FLOAT.unpack(FLOAT.pack(value))[0]
+
+
+# значение поля как в sort ответа ES: без рейтинга - в конце выдачи
+SORT_FIELDS = {
+    'imdb_rating': lambda row, order: (
+        (-math.inf if order == 'desc' else math.inf)
+        if row.imdb_rating is None else _float32(row.imdb_rating)
+        ),
+    'title.raw': lambda row, order: row.title,
+    'id': lambda row, order: row.id,
+}
+
+
+class SortedIds:
+    """Один порядок: фильмы, их значения sort и номер по id"""
+
+    def __init__(self, rows: List[SortRow], values: list):
+        self.rows = rows
+        self.ids = [row.id for row in rows]
+        self.values = values
+        self.positions: Dict[str, int] = {
+            id: position for position, id in enumerate(self.ids)
+            }
+
+    # номер первого фильма после курсора [значение поля, id]
+    def position_after(self, search_after: list, order: str) -> int:
+        last, last_id = search_after
+        if last in ('Infinity', '-Infinity'):
+            last = float(last)
+        position = self.positions.get(last_id)
+        if position is not None and self.values[position] == last:
+            return position + 1
+        # фильма курсора уже нет: сравнение по значениям
+        for position, (value, id) in enumerate(zip(self.values, self.ids)):
+            try:
+                if value != last:
+                    if (value > last) == (order == 'asc'):
+                        return position
+                elif id > last_id:
+                    return position
+            except TypeError:
+                # курсор другой сортировки
+                break
+        return len(self.ids)
+
+
+class SortedIndex:
+    """Порядки по ключу (жанр или None, поле, направление).
+
+    version - версия пространства movies, при которой индекс построен,
+    None - индекс не устаревает (документы в памяти, Storage.static).
+    """
+
+    def __init__(self, rows: Iterable[SortRow], version: Optional[int]):
+        self.version = version
+        rows = sorted(rows, key=lambda row: row.id)
+        self.orders: Dict[Tuple[Optional[str], str, str], SortedIds] = {}
+        for field, sort_value in SORT_FIELDS.items():
+            for order in ORDERS:
+                # сортировка устойчивая: при равенстве порядок по id,
+                # как tiebreaker в ES
+                ordered = sorted(
+                    rows,
+                    key=lambda row: sort_value(row, order),
+                    reverse=order == 'desc'
+                    )
+                by_genre = defaultdict(list)
+                for row in ordered:
+                    by_genre[None].append(row)
+                    for genre in row.genres:
+                        by_genre[genre].append(row)
+                for genre, genre_rows in by_genre.items():
+                    self.orders[genre, field, order] = SortedIds(
+                        genre_rows,
+                        [sort_value(row, order) for row in genre_rows]
+                        )
+
+    # срез порядка: [(фильм, sort)]; None - поле не поддерживается
+    def page(
+            self,
+            order: str,
+            sorted_field: str,
+            page_number: int,
+            page_size: int,
+            genre: Optional[str] = None,
+            search_after: Optional[list] = None
+            ) -> Optional[List[Tuple[SortRow, list]]]:
+        if sorted_field not in SORT_FIELDS or order not in ORDERS:
+            return None
+        ordered = self.orders.get((genre, sorted_field, order))
+        if ordered is None:
+            # фильмов жанра нет
+            return []
+        if search_after is None:
+            start = (page_number - 1) * page_size
+        else:
+            start = ordered.position_after(search_after, order)
+        end = start + page_size
+        return [
+            (row, [value, row.id]) for row, value in zip(
+                ordered.rows[start:end],
+                ordered.values[start:end]
+                )
+            ]
+
+
+def row_from_source(source: dict) -> SortRow:
+    return SortRow(
+        source['id'],
+        source.get('imdb_rating'),
+        source.get('title') or '',
+        tuple(genre['id'] for genre in source.get('genre') or [])
+        )
+
+
+class SortedIndexes:
+    """Текущий индекс воркера.
+
+    Из документов в памяти индекс строится при первом обращении. Из ES -
+    в фоне: пока он строится или устарел после перезаливки, get
+    возвращает None и страницы запрашиваются у ES как раньше.
+    """
+
+    def __init__(self, storage: Storage, versions: Versions):
+        self.storage = storage
+        self.versions = versions
+        self.index: Optional[SortedIndex] = None
+        self._building: Optional[asyncio.Task] = None
+        self._retry_at = 0.0
+
+    async def get(self) -> Optional[SortedIndex]:
+        if self.storage.static:
+            version = None
+        else:
+            version = (await self.versions.get(['movies']))['movies']
+        if self.index is not None and self.index.version == version:
+            return self.index
+        if self._building is None and self._retry_at <= time.monotonic():
+            self._building = asyncio.ensure_future(self._build(version))
+        building = self._building
+        if self.storage.static and building is not None:
+            await asyncio.shield(building)
+            return self.index
+        return None
+
+    async def _build(self, version: Optional[int]):
+        try:
+            sources = await self.storage.scan('movies', SOURCE_FIELDS)
+            if sources is None:
+                self._retry_at = time.monotonic() + RETRY_AFTER
+                logger.error('sorted index is not built: no movies index')
+                return
+            self.index = SortedIndex(map(row_from_source, sources), version)
+            logger.info(
+                'sorted index of %s movies built for version %s',
+                len(sources),
+                version
+                )
+        except Exception:
+            self._retry_at = time.monotonic() + RETRY_AFTER
+            logger.exception('sorted index is not built')
+        finally:
+            self._building = None
+
+
+@lru_cache()
+def get_sorted_indexes(store: Store, storage: Storage) -> SortedIndexes:
+    return SortedIndexes(storage, get_versions(store))
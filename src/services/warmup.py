@@ -0,0 +1,79 @@
+""" Прогрев кэша: список жанров и первые страницы главной
+
+Запускается из main.startup (CACHE_WARMUP_ENABLED) или отдельно из src:
+python -m services.warmup
+"""
+import asyncio
+
+import orjson
+
+from core.config import CacheSettings, CatalogSettings
+from core.get_logger import get_logger
+from db.storage import Storage, create_storage
+from db.store import Store, create_store
+from services.cache.cache import get_cache
+from services.genre import GenreService
+from services.movie import MovieService
+from services.sorting import sorting
+
+logger = get_logger()
+
+
+async def warm_up(store: Store, storage: Storage) -> int:
+    settings = CacheSettings()
+    genre_service = GenreService(store, storage)
+    movie_service = MovieService(store, storage)
+
+    genres = await genre_service.get_all_genres()
+    genre_ids = [genre['uuid'] for genre in orjson.loads(genres or b'[]')]
+
+    pages = []
+    for sort in settings.CACHE_WARMUP_SORTS:
+        order, sorted_field = sorting(sort)
+        for page_number in range(1, settings.CACHE_WARMUP_PAGES + 1):
+            args = (
+                order,
+                sorted_field,
+                page_number,
+                settings.CACHE_WARMUP_PAGE_SIZE
+                )
+            pages.append((movie_service.get_sorted_movies, args))
+            for genre in genre_ids:
+                pages.append((
+                    movie_service.get_genres_sorted_movies,
+                    args + (genre,)
+                    ))
+
+    # ограничение одновременных запросов, чтобы не положить ES
+    semaphore = asyncio.Semaphore(settings.CACHE_WARMUP_CONCURRENCY)
+
+    # прогретой считается только свежая страница: устаревшую
+    # get_page с fresh пересобирает, а не отдаёт как есть
+    async def warm(get_page, args) -> bool:
+        async with semaphore:
+            try:
+                return await get_page(*args, fresh=True) is not None
+            except Exception:
+                logger.exception('warm-up of %s failed', args)
+                return False
+
+    warmed = sum(await asyncio.gather(*(
+        warm(get_page, args) for get_page, args in pages
+        )))
+    await get_cache(store).drain()
+    logger.info('cache warm-up: genres and %s of %s pages', warmed, len(pages))
+    return warmed
+
+
+async def main():
+    store = create_store(CacheSettings())
+    storage = create_storage(CatalogSettings())
+    try:
+        await warm_up(store, storage)
+    finally:
+        await store.close()
+        await storage.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
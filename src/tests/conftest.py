@@ -0,0 +1,9 @@
+""" Тесты запускаются из src: python -m pytest tests
+
+Зависимости тестов: pip install pytest fakeredis
+"""
+import os
+import sys
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
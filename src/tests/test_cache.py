@@ -0,0 +1,213 @@
+""" Пакеты Cache поверх RedisStore с fakeredis: ошибки записи и чтения """
+import asyncio
+
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+import pytest
+from redis.exceptions import ConnectionError
+
+from core.config import CacheSettings
+from core.metrics import CACHE_REQUESTS
+from db.store import RedisStore
+from services.cache.cache import Cache
+from services.cache.codec import ALGORITHMS, CODEC_HEADER, CODEC_MAGIC, \
+    CODEC_VERSION, Codec
+from services.cache.keys import list_key
+from services.cache.popularity import Popularity
+from services.cache.single_flight import RedisSingleFlight
+from services.cache.versions import Versions, VersionedCache
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def make_cache(server: FakeServer = None) -> Cache:
+    return Cache(RedisStore(FakeRedis(server=server or FakeServer())))
+
+
+def test_read_and_write_in_one_step():
+    async def scenario():
+        cache = make_cache()
+        await cache.store.redis.set('movies:id:1', b'movie')
+        value, _ = await asyncio.gather(
+            cache.get('movies:id:1', 60),
+            cache.set('movies:id:2', b'other', 60)
+            )
+        await cache.drain()
+        return value, await cache.store.redis.get('movies:id:2')
+
+    assert run(scenario()) == (b'movie', b'other')
+
+
+def test_unsent_write_is_visible_to_read():
+    async def scenario():
+        cache = make_cache()
+        await cache.set('genres:all', b'[]', 60)
+        return await cache.get('genres:all', 60)
+
+    assert run(scenario()) == b'[]'
+
+
+def test_failing_write_does_not_fail_reads_and_counters():
+    async def scenario():
+        cache = make_cache()
+        await cache.store.redis.set('movies:id:1', b'movie')
+        # EX 0 redis отвергает: ошибка всего pipeline записей
+        results = await asyncio.gather(
+            cache.get('movies:id:1', 60),
+            cache.get('movies:id:404', 60),
+            cache.set('movies:id:bad', b'x', 0),
+            cache.set('movies:id:2', b'other', 60),
+            cache.incr('popularity:query', 60)
+            )
+        await cache.drain()
+        return results, await cache.store.redis.get('movies:id:2')
+
+    (found, missing, _, _, count), written = run(scenario())
+    assert found == b'movie'
+    assert missing is None
+    assert count == 1
+    # остальные записи пакета до redis дошли
+    assert written == b'other'
+
+
+def test_failing_write_is_logged(caplog):
+    async def scenario():
+        cache = make_cache()
+        await cache.set('movies:id:bad', b'x', 0)
+        await cache.drain()
+
+    run(scenario())
+    assert 'keys are not written to redis' in caplog.text
+
+
+def test_store_error_fails_reads_and_resolves_counters():
+    async def scenario():
+        server = FakeServer()
+        server.connected = False
+        cache = make_cache(server)
+        read = asyncio.ensure_future(cache.get('movies:id:1', 60))
+        count = await cache.incr('popularity:query', 60)
+        with pytest.raises(ConnectionError):
+            await read
+        return count
+
+    assert run(scenario()) == 0
+
+
+def test_corrupt_value_is_a_miss_for_its_key_only():
+    async def scenario():
+        cache = Cache(
+            RedisStore(FakeRedis(server=FakeServer())),
+            codec=Codec('zlib', 1)
+            )
+        redis = cache.store.redis
+        await cache.set('movies:id:1', b'movie' * 100, 60)
+        await cache.drain()
+        # заголовок zlib, но данные не сжаты
+        await redis.set(
+            'movies:id:bad',
+            CODEC_HEADER.pack(CODEC_MAGIC, CODEC_VERSION, 1) + b'garbage'
+            )
+        # заголовок обрезан
+        await redis.set('movies:id:short', CODEC_MAGIC)
+        return await asyncio.wait_for(
+            asyncio.gather(
+                cache.get('movies:id:bad', 60),
+                cache.get('movies:id:short', 60),
+                cache.get('movies:id:1', 60),
+                cache.incr('popularity:query', 60)
+                ),
+            1
+            )
+
+    assert run(scenario()) == [None, None, b'movie' * 100, 1]
+
+
+def test_single_flight_recheck_is_not_counted():
+    async def scenario():
+        cache = make_cache()
+        versioned = VersionedCache(cache, Versions(cache, 60), ('genres',))
+        single_flight = RedisSingleFlight(cache.store.redis, 5, 1)
+
+        async def recheck():
+            return await versioned.get('genres:all', 60)
+
+        async def build():
+            return b'[]'
+
+        await versioned.get('genres:all', 60)
+        return await single_flight.do('genres:all', build, recheck)
+
+    def counted():
+        return tuple(
+            CACHE_REQUESTS.value(namespace='genres', result=result)
+            for result in ('hit', 'miss')
+            )
+
+    hits, misses = counted()
+    assert run(scenario()) == b'[]'
+    # промах первого чтения учтён, перечитывание под блокировкой - нет
+    assert counted() == (hits, misses + 1)
+
+
+def test_popular_query_ttl_is_written_as_int():
+    async def scenario():
+        cache = make_cache()
+        settings = CacheSettings()
+        popularity = Popularity(
+            cache,
+            60,
+            1,
+            settings.CACHE_POPULARITY_MAX_TTL
+            )
+        counter = None
+        for _ in range(20):
+            counter = popularity.touch('movies', 'star')
+        ttl = await popularity.ttl(counter, 60 * 60)
+        await cache.set('movies:search:star', b'[]', ttl)
+        await cache.drain()
+        redis = cache.store.redis
+        return ttl, await redis.ttl('movies:search:star')
+
+    ttl, expire = run(scenario())
+    assert ttl == CacheSettings().CACHE_POPULARITY_MAX_TTL
+    assert isinstance(ttl, int)
+    assert 0 < expire <= ttl
+
+
+def test_float_ttl_is_rounded_for_redis():
+    async def scenario():
+        cache = make_cache()
+        await cache.set('movies:id:1', b'movie', 86400.0)
+        await cache.drain()
+        return await cache.store.redis.get('movies:id:1')
+
+    assert run(scenario()) == b'movie'
+
+
+def test_popularity_ttl_grows_after_step_lookups():
+    async def scenario():
+        cache = make_cache()
+        popularity = Popularity(cache, 60 * 60, 2, 24 * 60 * 60)
+        ttls = []
+        for _ in range(6):
+            counter = popularity.touch('movies', 'star')
+            ttls.append(await popularity.ttl(counter, 60 * 60))
+        key = list_key('movies', 'popularity', query='star')
+        return ttls, await cache.store.redis.ttl(key)
+
+    ttls, window = run(scenario())
+    assert ttls == [3600, 7200, 7200, 14400, 14400, 28800]
+    # счётчик переживает ответ с базовым TTL
+    assert window > 24 * 60 * 60 - 5
+
+
+def test_auto_codec_is_lz4_or_none():
+    codec = Codec('auto', 0)
+    if 'lz4' in ALGORITHMS:
+        assert codec.algorithm is ALGORITHMS['lz4']
+    else:
+        assert codec.algorithm is None
+    assert codec.decode(codec.encode(b'x' * 1024)) == b'x' * 1024
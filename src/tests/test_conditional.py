@@ -0,0 +1,30 @@
+""" ETag и Cache-Control условных ответов """
+from http import HTTPStatus
+
+from fastapi.responses import Response
+
+from api.v1.conditional import MAX_AGE, conditional_response, etag
+
+
+def test_etag_depends_on_representation():
+    payload = b'{"id":"1"}'
+    assert etag(payload) == etag(payload)
+    assert etag(payload, 'MovieInfo.1') != etag(payload)
+    assert etag(payload, 'MovieInfo.1') != etag(payload, 'MovieInfo.2')
+
+
+def test_matching_etag_is_not_modified_with_short_max_age():
+    payload = b'[]'
+    response = Response()
+    tag = etag(payload, 'Genre.1')
+    not_modified = conditional_response(response, payload, [tag], 'Genre.1')
+    assert not_modified.status_code == HTTPStatus.NOT_MODIFIED
+    assert not_modified.headers['Cache-Control'] == \
+        'public, max-age={0}'.format(MAX_AGE)
+    assert response.headers['ETag'] == tag
+
+
+def test_other_etag_gets_body():
+    response = Response()
+    assert conditional_response(response, b'[]', ['"x"']) is None
+    assert response.headers['ETag'] == etag(b'[]')
@@ -0,0 +1,24 @@
+""" /metrics: попадания L1 рядом с попаданиями пространств кэша """
+from core.metrics import render
+from services.cache.local import LocalCache
+
+
+def test_l1_stats_are_rendered():
+    local = LocalCache(10, 1024)
+    local.set('movies:id:1', b'movie', 60)
+    local.get('movies:id:1')
+    local.get('movies:id:1')
+    local.get('movies:id:2')
+    lines = render(local.stats()).splitlines()
+    assert 'cache_requests_total{namespace="l1",result="hit"} 2' in lines
+    assert 'cache_requests_total{namespace="l1",result="miss"} 1' in lines
+    assert any(
+        line.startswith('cache_hit_ratio{namespace="l1"} 0.66')
+        for line in lines
+        )
+    assert 'cache_l1_items 1' in lines
+    assert 'cache_l1_evictions_total 0' in lines
+
+
+def test_without_l1_there_is_no_l1_namespace():
+    assert 'namespace="l1"' not in render()
@@ -0,0 +1,51 @@
+""" Курсоры search_after: привязка к списку и сортировке """
+import pytest
+
+from services.pagination import InvalidCursor, MOVIES_SCORE_SORT, \
+    PERSONS_SCORE_SORT, cursor_sort, decode_cursor, encode_cursor
+
+RATING = cursor_sort('desc', 'imdb_rating')
+
+
+def test_cursor_round_trip():
+    values = [8.5, '025c58cd-1b7e-43be-9ffb-8571a613579b']
+    assert decode_cursor(encode_cursor(RATING, values), RATING) == values
+
+
+def test_infinity_is_encoded_as_string():
+    cursor = encode_cursor(RATING, [float('-inf'), 'id'])
+    assert decode_cursor(cursor, RATING) == ['-Infinity', 'id']
+
+
+@pytest.mark.parametrize('sort', [
+    cursor_sort('asc', 'imdb_rating'),
+    cursor_sort('desc', 'title.raw'),
+    MOVIES_SCORE_SORT,
+    ])
+def test_cursor_of_another_sort_is_rejected(sort):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(encode_cursor(RATING, [8.5, 'id']), sort)
+
+
+def test_search_cursor_is_bound_to_entity():
+    cursor = encode_cursor(MOVIES_SCORE_SORT, [3.2, 'id'])
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, PERSONS_SCORE_SORT)
+
+
+@pytest.mark.parametrize('cursor', ['%%%', 'bm90IGpzb24', 'WzFd', ''])
+def test_broken_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, RATING)
+
+
+@pytest.mark.parametrize('values', [
+    [8.5, ['id']],
+    [8.5, 1],
+    [8.5, None],
+    [[8.5], 'id'],
+    [{'value': 8.5}, 'id'],
+    ])
+def test_cursor_values_of_wrong_type_are_rejected(values):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(encode_cursor(RATING, values), RATING)
@@ -0,0 +1,83 @@
+""" Поиск фильмов: ключ кэша по нормализованному запросу, в ES - исходный """
+import asyncio
+from typing import Dict, List, Optional
+
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from db.storage import Storage
+from db.store import RedisStore
+from services.cache.cache import get_cache
+from services.cache.keys import list_key
+from services.movie import MovieService
+
+
+MOVIE_ID = '025c58cd-1b7e-43be-9ffb-8571a613579b'
+
+
+class SearchStorage(Storage):
+    """Хранилище с одним фильмом, запоминает тела поисковых запросов"""
+
+    def __init__(self):
+        self.bodies: List[dict] = []
+
+    async def get(self, index: str, id: str) -> Optional[dict]:
+        return None
+
+    async def mget(self, index: str, ids: List[str]) -> Dict[str, dict]:
+        return {}
+
+    async def search(self, index: str, body: dict) -> Optional[List[dict]]:
+        self.bodies.append(body)
+        return [{
+            '_id': MOVIE_ID,
+            '_source': {
+                'id': MOVIE_ID,
+                'title': 'Star Wars',
+                'imdb_rating': 8.6
+                },
+            'sort': [1.0, MOVIE_ID],
+            }]
+
+    async def scan(self, index: str, fields=None) -> Optional[List[dict]]:
+        return None
+
+    async def ping(self) -> bool:
+        return True
+
+    async def close(self):
+        pass
+
+
+def search(queries: List[str]):
+    async def scenario():
+        store = RedisStore(FakeRedis(server=FakeServer()))
+        storage = SearchStorage()
+        service = MovieService(store, storage)
+        pages = [
+            await service.get_find_movies(query, 1, 10) for query in queries
+            ]
+        await get_cache(store).drain()
+        counter = await store.redis.get(
+            list_key('movies', 'popularity', query='star wars')
+            )
+        return pages, storage.bodies, int(counter or 0)
+
+    return asyncio.run(scenario())
+
+
+def test_elastic_gets_query_as_typed():
+    _, bodies, _ = search(['  Star Wars '])
+    assert bodies[0]['query']['multi_match']['query'] == 'Star Wars'
+
+
+def test_case_variants_share_cache_entry():
+    pages, bodies, _ = search(['Star Wars', 'star  WARS'])
+    assert len(bodies) == 1
+    assert pages[0] == pages[1]
+
+
+def test_local_hit_is_not_counted():
+    # второй и третий поиск отвечает L1 воркера
+    _, _, counter = search(['Star Wars', 'star wars', 'STAR WARS'])
+    assert counter == 1
@@ -0,0 +1,129 @@
+""" Готовые порядки главной: страницы и курсоры как у ES """
+import asyncio
+
+import pytest
+
+from benchmarks.fake_elastic import FakeElasticsearch
+from services.query_to_es.genre_sorted_movie import genre_sorted_movie_query
+from services.sorted_index import SortRow, SortedIndex, _float32, \
+    row_from_source
+
+DRAMA = '6c162475-c7ed-4461-9184-001ef3d9f26e'
+
+
+def make_index(*rows: SortRow) -> SortedIndex:
+    return SortedIndex(rows, None)
+
+
+def ids(page) -> list:
+    return [row.id for row, _ in page]
+
+
+def test_cursor_of_removed_movie_continues_by_value():
+    index = make_index(
+        SortRow('a', 8.0, 'A', ()),
+        SortRow('c', 7.0, 'C', ()),
+        SortRow('d', 7.0, 'D', ()),
+        SortRow('e', 6.0, 'E', ()),
+        )
+    # фильм b с рейтингом 7.0 был между a и c, его уже нет в индексе
+    page = index.page('desc', 'imdb_rating', 1, 10, None, [7.0, 'b'])
+    assert ids(page) == ['c', 'd', 'e']
+    # фильм с рейтингом 7.5 после a
+    page = index.page('desc', 'imdb_rating', 1, 10, None, [7.5, 'x'])
+    assert ids(page) == ['c', 'd', 'e']
+    page = index.page('asc', 'imdb_rating', 1, 10, None, [7.0, 'cc'])
+    assert ids(page) == ['d', 'a']
+
+
+def test_float32_ties_are_ordered_by_id():
+    # разные float64, но один float32 - как их видит ES
+    index = make_index(
+        SortRow('b', 7.1, 'B', ()),
+        SortRow('a', 7.1000001, 'A', ()),
+        SortRow('c', 7.2, 'C', ()),
+        )
+    assert _float32(7.1) == _float32(7.1000001)
+    page = index.page('desc', 'imdb_rating', 1, 10)
+    assert ids(page) == ['c', 'a', 'b']
+    assert [values for _, values in page][1] == [_float32(7.1), 'a']
+    # курсор на a: следующий b с тем же значением
+    after = index.page('desc', 'imdb_rating', 1, 10, None, page[1][1])
+    assert ids(after) == ['b']
+
+
+def test_movies_without_rating_are_last():
+    index = make_index(
+        SortRow('a', None, 'A', ()),
+        SortRow('b', 5.0, 'B', ()),
+        )
+    for order in ('asc', 'desc'):
+        page = index.page(order, 'imdb_rating', 1, 10)
+        assert ids(page) == ['b', 'a']
+    page = index.page('desc', 'imdb_rating', 1, 10, None, ['-Infinity', 'a'])
+    assert page == []
+
+
+def test_unknown_or_empty_genre_is_empty_page():
+    index = make_index(SortRow('a', 8.0, 'A', ('g',)))
+    assert ids(index.page('desc', 'imdb_rating', 1, 10, 'g')) == ['a']
+    assert index.page('desc', 'imdb_rating', 1, 10, 'unknown') == []
+    assert make_index().page('desc', 'imdb_rating', 1, 10) == []
+    assert make_index().page('asc', 'title.raw', 1, 10, 'g') == []
+
+
+def test_unsupported_sort_is_not_served():
+    index = make_index(SortRow('a', 8.0, 'A', ()))
+    assert index.page('desc', 'description', 1, 10) is None
+
+
+def es_pages(elastic, order, field, page_size, pages):
+    async def scenario():
+        result = []
+        search_after = None
+        for _ in range(pages):
+            body = genre_sorted_movie_query(
+                order,
+                field,
+                1,
+                page_size,
+                DRAMA,
+                search_after
+                )
+            hits = (await elastic.search('movies', body))['hits']['hits']
+            result.append(hits)
+            if len(hits) < page_size:
+                break
+            search_after = hits[-1]['sort']
+        return result
+
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+@pytest.mark.parametrize('field', ['imdb_rating', 'title.raw'])
+def test_pages_match_elastic(order, field):
+    elastic = FakeElasticsearch()
+    index = SortedIndex(
+        map(row_from_source, elastic.indices['movies'].values()),
+        None
+        )
+    page_size = 50
+    pages = es_pages(elastic, order, field, page_size, 8)
+    assert len(pages) > 1
+    search_after = None
+    for hits in pages:
+        page = index.page(
+            order,
+            field,
+            1,
+            page_size,
+            DRAMA,
+            search_after
+            )
+        assert ids(page) == [hit['_id'] for hit in hits]
+        # ES отдаёт рейтинг в sort как float32, бенчмарочный - как есть
+        value, last_id = hits[-1]['sort']
+        if field == 'imdb_rating' and isinstance(value, float):
+            value = _float32(value)
+        search_after = [value, last_id]